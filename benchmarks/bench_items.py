@@ -0,0 +1,62 @@
+"""Compare memory use and access speed of dict-backed Items and CompactItems.
+
+Usage: python benchmarks/bench_items.py [n_items]
+"""
+import sys
+import timeit
+import tracemalloc
+
+from fetchfox_sdk.item import Item
+from fetchfox_sdk.results import ResultStore
+
+
+FIELDS = ["name", "price", "url", "rating", "description", "_meta"]
+
+
+def make_items(n):
+    for i in range(n):
+        yield {
+            "name": f"Product {i}",
+            "price": i * 1.5,
+            "url": f"https://example.com/products/{i}",
+            "rating": i % 5,
+            "description": "A product",
+            "_meta": None,
+        }
+
+
+def measure(build, n):
+    tracemalloc.start()
+    items = build(n)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return items, current
+
+
+def bench_access(items):
+    def access():
+        for item in items:
+            item.name
+            item["price"]
+            item.get("rating")
+    return min(timeit.repeat(access, number=1, repeat=5))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    dict_items, dict_bytes = measure(
+        lambda n: [Item(d) for d in make_items(n)], n)
+    store, store_bytes = measure(lambda n: ResultStore(make_items(n)), n)
+    compact_items = store.views()
+
+    print(f"{n} items with {len(FIELDS)} fields")
+    print(f"{'':16}{'bytes/item':>12}{'access s':>12}")
+    for label, nbytes, items in [
+            ("Item(dict)", dict_bytes, dict_items),
+            ("CompactItem", store_bytes, compact_items)]:
+        print(f"{label:16}{nbytes / n:>12.1f}{bench_access(items):>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
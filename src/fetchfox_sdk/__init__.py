@@ -1,6 +1,10 @@
 from .client import FetchFox
+from .async_client import AsyncFetchFox
 from .workflow import Workflow
-from .item import Item
+from .item import Item, CompactItem
+from .retry import RetryPolicy
+from .ratelimit import RateLimiter
+from .cache import ResultCache
 
 __version__ =  "0.3.0"
-__all__ = ["FetchFox", "Workflow", "Item"]
\ No newline at end of file
+__all__ = ["FetchFox", "AsyncFetchFox", "Workflow", "Item", "CompactItem", "RetryPolicy", "RateLimiter", "ResultCache"]
\ No newline at end of file
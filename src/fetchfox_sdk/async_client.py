@@ -0,0 +1,315 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+import requests
+
+try:
+    import httpx
+except ImportError: # pragma: no cover - optional dependency
+    httpx = None
+
+from .client import FetchFox
+from .jobs import AsyncJobStream, JobProgress
+from .polling import PollScheduler
+from .retry import retry_after_seconds
+from .workflow import Workflow
+
+
+class AsyncFetchFox(FetchFox):
+    """asyncio flavor of the FetchFox client.
+
+    Workflows are built exactly as with `FetchFox`, but can also be consumed
+    without blocking the event loop:
+
+    ```
+    async with AsyncFetchFox() as fox:
+        workflow = fox.extract(url, {"title": "Find me all the titles"})
+
+        async for item in workflow:
+            print(item.title)
+
+        # or
+        items = await workflow.all_results_async()
+        await workflow.export_async("titles.jsonl")
+    ```
+
+    Many jobs may be followed concurrently on one event loop, without a
+    thread per job.  The synchronous API remains available as well.
+
+    Requires the optional `httpx` dependency:
+    `pip install fetchfox-sdk[async]`
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Accepts the same arguments as `FetchFox`."""
+        if httpx is None:
+            raise ImportError(
+                "AsyncFetchFox requires httpx.  "
+                "Install it with: pip install fetchfox-sdk[async]")
+        super().__init__(*args, **kwargs)
+        self._aclient = None
+
+    def _async_client(self):
+        # Created lazily, so that it binds to the running event loop
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=30,
+                limits=httpx.Limits(
+                    max_connections=self._transport.pool_maxsize,
+                    max_keepalive_connections=self._transport.pool_maxsize,
+                    keepalive_expiry=self._transport.idle_timeout))
+        return self._aclient
+
+    async def aclose(self):
+        """Close the async connection pool, and everything `close()` does,
+        without waiting for background tasks."""
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+        self.close(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    @staticmethod
+    def _as_requests_error(error):
+        """Map httpx transport errors onto the requests exception types used
+        throughout the SDK (and by RetryPolicy)."""
+        if isinstance(error, httpx.ConnectTimeout):
+            return requests.exceptions.ConnectTimeout(str(error))
+        if isinstance(error, httpx.TimeoutException):
+            return requests.exceptions.Timeout(str(error))
+        return requests.exceptions.ConnectionError(str(error))
+
+    async def _asend(self, method: str, path: str, **kwargs):
+        """Async counterpart of FetchFox._send."""
+        client = self._async_client()
+
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            wait = self._rate_limit_wait()
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                try:
+                    response = await client.request(method, path, **kwargs)
+                except httpx.TransportError as e:
+                    raise self._as_requests_error(e) from e
+                if response.status_code >= 400:
+                    raise requests.exceptions.HTTPError(
+                        f"{response.status_code} Error for url: {response.url}",
+                        response=response)
+                self._rate_limit_result()
+                return response
+            except requests.exceptions.RequestException as e:
+                self._rate_limit_result(e)
+                delay = self._retry_delay(method, path, attempt, e, started)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _arequest(self, method: str, path: str,
+            json_data: Optional[dict] = None,
+            params: Optional[dict] = None,
+            body: Optional[str] = None) -> dict:
+        """Async counterpart of FetchFox._request."""
+        if body is not None:
+            response = await self._asend(
+                method, path, content=body.encode("utf-8"), params=params)
+        else:
+            response = await self._asend(
+                method, path, json=json_data, params=params)
+        body = response.json()
+
+        self._log_response(method, path, response, body)
+        return body
+
+    async def _aregister_workflow(self, workflow: Workflow) -> str:
+        if self.reference_results and workflow._has_result_references():
+            try:
+                response = await self._arequest('POST', 'workflows',
+                    body=workflow.to_json(reference=True))
+                return response['id']
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code not in (400, 422):
+                    raise
+                self._no_result_references()
+
+        response = await self._arequest(
+            'POST', 'workflows', body=workflow.to_json())
+        return response['id']
+
+    async def _aregister_workflow_cached(self, workflow: Workflow):
+        """Async counterpart of FetchFox._register_workflow_cached."""
+        digest = self._workflow_digest(workflow)
+        workflow_id = self._registration_cache.get(digest)
+        if workflow_id is not None:
+            self.logger.debug("Reusing registered workflow: %s", workflow_id)
+            return workflow_id, True
+
+        workflow_id = await self._aregister_workflow(workflow)
+        self.logger.info("Registered new workflow with id: %s", workflow_id)
+        self._registration_cache.put(digest, workflow_id)
+        return workflow_id, False
+
+    async def _arun_workflow(self, workflow_id: Optional[str] = None,
+            workflow: Optional[Workflow] = None, detached=False,
+            params: Optional[dict] = None) -> str:
+        """Async counterpart of FetchFox._run_workflow."""
+        self._check_run_workflow_args(workflow_id, workflow, params)
+        body = self._run_body(workflow, params)
+
+        cached = False
+        if workflow_id is None:
+            workflow_id, cached = await self._aregister_workflow_cached(workflow) # type: ignore
+
+        slot = None if detached else await self._aacquire_job_slot()
+        try:
+            try:
+                response = await self._arequest(
+                    'POST', f'workflows/{workflow_id}/run', body)
+            except requests.exceptions.HTTPError as e:
+                if not (cached and e.response.status_code == 404):
+                    raise
+                self.logger.info("Cached workflow %s no longer exists", workflow_id)
+                self._registration_cache.invalidate(self._workflow_digest(workflow))
+                workflow_id, _ = await self._aregister_workflow_cached(workflow) # type: ignore
+                response = await self._arequest(
+                    'POST', f'workflows/{workflow_id}/run', body)
+        except BaseException:
+            self._release_job_slot(slot)
+            raise
+        if not detached:
+            self._attached_jobs.append(response['jobId'])
+            self._job_started(response['jobId'], slot)
+        return response['jobId']
+
+    async def _astop_job(self, job_id: str) -> bool:
+        """Async counterpart of FetchFox._stop_job."""
+        if job_id not in self._attached_jobs:
+            return False
+        try:
+            await self._arequest("POST", f"jobs/{job_id}/stop")
+            self.logger.info("Stopped job: %s", job_id)
+        except requests.exceptions.RequestException as e:
+            self.logger.warning("Failed to stop job [%s]: %s", job_id, e)
+        self._job_done(job_id)
+        if self._watcher is not None:
+            self._watcher.unwatch(job_id)
+        return True
+
+    def stream_job_async(self, job_id: str, cursor: Optional[str] = None,
+            seen_ids: Optional[Iterable[str]] = None,
+            poll_min_interval: Optional[float] = None,
+            poll_max_interval: Optional[float] = None) -> AsyncJobStream:
+        """Async counterpart of `stream_job()`: iterate with `async for`."""
+        progress = self._stream_progress(job_id, cursor, seen_ids)
+        return AsyncJobStream(progress, self._ajob_result_items_gen(
+            job_id, progress=progress,
+            poll_min_interval=poll_min_interval,
+            poll_max_interval=poll_max_interval))
+
+    async def _aacquire_job_slot(self):
+        """Async counterpart of FetchFox._acquire_job_slot."""
+        if self.rate_limiter is None:
+            return None
+        while True:
+            slot = self.rate_limiter.acquire_job(block=False)
+            if slot is not None:
+                return slot
+            await asyncio.sleep(0.5)
+
+    async def run_detached_async(self, workflow) -> str:
+        """Async counterpart of `run_detached()`."""
+        return await self._arun_workflow(workflow=workflow, detached=True)
+
+    async def _apoll_status_once(self, job_id,
+            progress: Optional[JobProgress] = None,
+            scheduler: Optional[PollScheduler] = None):
+        """Async counterpart of FetchFox._poll_status_once."""
+        MAX_WAIT_FOR_JOB_ALIVE_MINUTES = 5
+        if scheduler is None:
+            scheduler = self._poll_scheduler()
+        started_waiting_for_job_dt = None
+        while True:
+            params = progress.poll_params() if progress is not None else None
+            try:
+                return await self._arequest('GET', f'jobs/{job_id}', params=params)
+            except requests.exceptions.HTTPError as e:
+                if params is not None and e.response.status_code == 400:
+                    progress.fall_back()
+                    continue
+
+                if e.response.status_code not in [404, 500]:
+                    raise
+
+                self.logger.info("Waiting for job %s to be scheduled.", job_id)
+                if started_waiting_for_job_dt is None:
+                    started_waiting_for_job_dt = datetime.now()
+                else:
+                    waited = datetime.now() - started_waiting_for_job_dt
+                    if waited > timedelta(minutes=MAX_WAIT_FOR_JOB_ALIVE_MINUTES):
+                        raise RuntimeError(
+                            f"Job {job_id} is taking unusually long to schedule.")
+
+                await asyncio.sleep(scheduler.unscheduled(
+                    hint=retry_after_seconds(e.response)))
+
+    async def _ajob_result_items_gen(self, job_id,
+            raw_log_level=logging.ERROR,
+            log_summaries_dest=None,
+            intermediate_items_dest=None,
+            progress: Optional[JobProgress] = None,
+            poll_min_interval: Optional[float] = None,
+            poll_max_interval: Optional[float] = None):
+        """Async counterpart of FetchFox._job_result_items_gen."""
+        self.logger.info(f"Streaming results from: [{job_id}]: ")
+
+        if progress is None:
+            progress = self._new_job_progress(
+                job_id, raw_log_level, log_summaries_dest, intermediate_items_dest)
+        scheduler = self._poll_scheduler(poll_min_interval, poll_max_interval)
+
+        MAX_WAIT_FOR_CHANGE_MINUTES = 5
+        first_response_dt = None
+
+        try:
+            while True:
+                response = await self._apoll_status_once(
+                    job_id, progress=progress, scheduler=scheduler)
+                if not first_response_dt:
+                    first_response_dt = datetime.now()
+
+                new_items = self._consume_job_status(
+                    progress, response,
+                    raw_log_level=raw_log_level,
+                    log_summaries_dest=log_summaries_dest,
+                    intermediate_items_dest=intermediate_items_dest)
+
+                if new_items is None:
+                    waited_dur = datetime.now() - first_response_dt
+                    if waited_dur > timedelta(minutes=MAX_WAIT_FOR_CHANGE_MINUTES):
+                        raise RuntimeError(
+                            "This job is taking too long - please retry.")
+                    new_items = []
+
+                for item in new_items:
+                    yield item
+
+                if progress.done:
+                    break
+
+                await asyncio.sleep(scheduler.next_delay(
+                    len(new_items), hint=response.get('pollInterval')))
+        finally:
+            self._job_finished(job_id)
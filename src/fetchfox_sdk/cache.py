@@ -0,0 +1,273 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+
+def canonical_json(data) -> str:
+    """Serialize data so that equal structures always give the same string."""
+    return json.dumps(
+        data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def workflow_digest(workflow_dict: dict, namespace: str = "") -> str:
+    """A stable content hash of a workflow definition.
+
+    Args:
+        workflow_dict: the workflow, as from `Workflow.to_dict()`
+        namespace: mixed into the hash, e.g. to separate API hosts/accounts
+    """
+    h = hashlib.sha256()
+    h.update(namespace.encode("utf-8"))
+    h.update(b"\n")
+    h.update(canonical_json(workflow_dict).encode("utf-8"))
+    return h.hexdigest()
+
+
+def create_temp_file(directory: str, prefix: str, suffix: str = ""):
+    """Like `tempfile.mkstemp()`, for a file which will be renamed into
+    place: it gets the permissions a plain `open()` would give it (0666
+    less the umask), rather than mkstemp's 0600.
+
+    Returns:
+        (fd, path), the file descriptor being open for writing
+    """
+    flags = os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    for _ in range(tempfile.TMP_MAX):
+        path = os.path.join(directory, f"{prefix}{uuid.uuid4().hex[:12]}{suffix}")
+        try:
+            return os.open(path, flags, 0o666), path
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"No usable temporary file name in {directory}")
+
+
+def _atomic_write_json(path: str, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = create_temp_file(directory, ".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class RegistrationCache:
+    """Maps workflow content hashes to server-side workflow IDs, so that
+    running an identical workflow again doesn't register it again.
+
+    Entries are kept in memory with LRU eviction.  If a `path` is given, they
+    are also persisted to that JSON file and shared with other processes
+    using the same file.
+    """
+
+    def __init__(self, max_size: int = 256, path: Optional[str] = None):
+        """
+        Args:
+            max_size: max number of workflow IDs to remember
+            path: optional JSON file to persist the cache across processes
+        """
+        self.max_size = max_size
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            self._entries.update(self._load())
+            self._trim()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _trim(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _save(self, removed=()):
+        if self.path is None:
+            return
+        # Merge with what other processes may have written meanwhile
+        merged = OrderedDict(self._load())
+        merged.update(self._entries)
+        for digest in removed:
+            merged.pop(digest, None)
+        while len(merged) > self.max_size:
+            merged.popitem(last=False)
+        _atomic_write_json(self.path, merged)
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            workflow_id = self._entries.get(digest)
+            if workflow_id is None and self.path is not None:
+                # Another process may have registered it since we loaded
+                workflow_id = self._load().get(digest)
+                if workflow_id is not None:
+                    self._entries[digest] = workflow_id
+                    self._trim()
+            if workflow_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return workflow_id
+
+    def put(self, digest: str, workflow_id: str):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[digest] = workflow_id
+            self._entries.move_to_end(digest)
+            self._trim()
+            self._save()
+
+    def invalidate(self, digest: str):
+        """Forget a workflow ID, e.g. because the server no longer knows it."""
+        with self._lock:
+            self._entries.pop(digest, None)
+            self._save(removed=[digest])
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class ResultCache:
+    """Opt-in, on-disk cache of workflow results.
+
+    Results are stored one file per workflow, as gzipped JSON lines, keyed
+    by a hash of the canonical workflow JSON.  Running an identical workflow
+    again (e.g. while iterating on a script) returns the stored results
+    instead of running a new job.
+
+    Entries older than `ttl` seconds are ignored and removed.  When the
+    cache grows beyond `max_bytes`, the least recently used entries are
+    evicted.
+
+    ```
+    fox = FetchFox(result_cache=ResultCache("~/.cache/fetchfox", ttl=86400))
+    ```
+    """
+
+    SUFFIX = ".jsonl.gz"
+
+    def __init__(self, directory: str, ttl: Optional[float] = None,
+            max_bytes: Optional[int] = 512 * 1024 * 1024):
+        """
+        Args:
+            directory: where to store cached results.  Created if needed.
+            ttl: seconds after which cached results are stale.  None to keep them until evicted.
+            max_bytes: max total size of the cache on disk.  None for no limit.
+        """
+        self.directory = os.path.expanduser(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest + self.SUFFIX)
+
+    def get(self, digest: str) -> Optional[list]:
+        """Return the cached results (a list of dicts), or None."""
+        path = self._path(digest)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if (self.ttl is not None
+                        and time.time() - header["created"] > self.ttl):
+                    items = None
+                else:
+                    items = [json.loads(line) for line in f]
+        except (OSError, ValueError, KeyError, EOFError):
+            items = None
+            header = None
+
+        if items is None:
+            if header is not None:
+                # Expired
+                self._remove(path)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path) # mtime tracks recency, for LRU eviction
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return items
+
+    def put(self, digest: str, items: list):
+        """Store the results of a workflow."""
+        fd, tmp_path = create_temp_file(self.directory, ".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as raw, \
+                    gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                lines = [json.dumps({"created": time.time(), "count": len(items)})]
+                lines.extend(json.dumps(item) for item in items)
+                gz.write(("\n".join(lines) + "\n").encode("utf-8"))
+            os.replace(tmp_path, self._path(digest))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._evict()
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def size(self) -> int:
+        """Total bytes used on disk."""
+        return sum(size for _, size, _ in self._entries())
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
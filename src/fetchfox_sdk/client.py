@@ -1,20 +1,33 @@
 import requests
+import urllib3
 import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Union, Any
+from typing import Callable, Dict, Iterable, List, Optional, Union, Any
 import json
+import hashlib
 from pprint import pformat
 from urllib.parse import urljoin, urlencode
 import os
 import sys
 import logging
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from queue import Queue
 import threading
 import signal
 
 from .workflow import Workflow
 from .item import Item
+from .transport import PooledTransport
+from .retry import RetryPolicy, retry_after_seconds
+from .ratelimit import RateLimiter
+from .polling import PollScheduler
+from .watcher import JobWatcher
+from .streaming import (
+    iter_job_status, streaming_available, DECODE_ERRORS,
+    INTERMEDIATE_PREFIX, LOG_SUMMARIES_PREFIX, RAW_LOGS_PREFIX)
+from .jobs import JobProgress, JobStream
+from .sharding import ShardedRun
+from .cache import RegistrationCache, ResultCache, workflow_digest
 
 
 TRACE = 5
@@ -38,7 +51,28 @@ class FetchFox:
 
     def __init__(self,
             api_key: Optional[str] = None, host: str = "https://fetchfox.ai",
-            log_level="warning"):
+            log_level="warning",
+            pool_connections: int = 10, pool_maxsize: int = 10,
+            pool_block: bool = False, idle_timeout: Optional[float] = 60.0,
+            retry_policy: Optional[RetryPolicy] = None,
+            incremental_results: bool = True,
+            poll_min_interval: float = 0.5, poll_max_interval: float = 10.0,
+            job_watcher: bool = True, watcher_concurrency: int = 8,
+            max_workers: Optional[int] = None,
+            executor: Optional[Executor] = None,
+            max_pending: Optional[int] = None,
+            trace_max_chars: Optional[int] = None,
+            trace_size_only: bool = False,
+            response_hook: Optional[Callable] = None,
+            stream_status: bool = True,
+            workflow_cache_size: int = 256,
+            workflow_cache_path: Optional[str] = None,
+            result_cache: Optional[ResultCache] = None,
+            reference_results: bool = False,
+            shard_size: Optional[int] = None,
+            shard_concurrency: int = 4,
+            rate_limiter: Optional[RateLimiter] = None,
+            stop_abandoned_jobs: bool = True):
         """Initialize the FetchFox SDK.
 
         You may also provide an API key in the environment variable `FETCHFOX_API_KEY`.
@@ -47,6 +81,31 @@ class FetchFox:
             api_key: Your FetchFox API key.  Overrides the environment variable.
             host: API host URL (defaults to production)
             log_level: debug|info|warning|error|critical, print logs >= this level to the console
+            pool_connections: number of per-host connection pools to keep
+            pool_maxsize: max keep-alive connections per host.  Raise this if you run many workflows concurrently.
+            pool_block: if True, wait for a free pooled connection rather than opening an extra one
+            idle_timeout: seconds of inactivity after which pooled connections are dropped (None to never drop them)
+            retry_policy: a RetryPolicy deciding how failed API calls are retried.  Defaults to RetryPolicy().  Pass RetryPolicy(max_retries=0) to disable retries.
+            incremental_results: when polling a job, ask the server for only the items added since the last poll.  Falls back to full polls automatically if the server doesn't support it.
+            poll_min_interval: shortest wait between job status polls, used while results are arriving
+            poll_max_interval: longest wait between job status polls, reached while a job is idle or not yet scheduled
+            job_watcher: poll all jobs started by `Workflow.results_future()` from one shared background watcher, rather than one thread per job
+            watcher_concurrency: max status requests the watcher sends at once, when the server has no bulk status endpoint
+            max_workers: size of the thread pool used for background work (starting jobs, polling, and `results_future()` when the job watcher is off).  Defaults to the ThreadPoolExecutor default.
+            executor: use this concurrent.futures.Executor instead of creating one.  It will not be shut down by `close()`.
+            max_pending: max background tasks queued or running at once.  Submitting more (e.g. calling `results_future()`) blocks until one finishes.  None for no limit.
+            trace_max_chars: at log_level="trace", truncate logged response bodies to this many characters
+            trace_size_only: at log_level="trace", log only the size of each response body
+            response_hook: called as hook(method, path, response, body) for every API response, e.g. for metrics
+            stream_status: decode job statuses incrementally, yielding items as they are parsed and skipping sections that aren't needed.  Only takes effect when the optional ijson package is installed.
+            workflow_cache_size: how many registered workflows to remember, so running an identical workflow again reuses its ID instead of registering it again.  0 disables this.
+            workflow_cache_path: optional JSON file in which to persist registered workflow IDs, shared across processes
+            result_cache: a ResultCache to look up results of identical workflows in before running them, and to store results in when jobs complete.  Off by default.
+            reference_results: when a workflow is derived from one which already has results, have the server read those results from the original job, instead of uploading them again.  Falls back to uploading them if the server doesn't support it.
+            shard_size: run workflows which start from more than this many items (e.g. URLs given to `init()`) as several jobs of at most this many items each.  None to always run one job.  See `Workflow.set_sharding()`.
+            shard_concurrency: max jobs of one sharded workflow running at once
+            rate_limiter: a RateLimiter pacing every API call, and optionally capping the number of jobs running at once.  Slows down automatically when the server answers 429.  Off by default.
+            stop_abandoned_jobs: stop a workflow's job on the server when iteration over its results ends early, e.g. with `break`, instead of leaving it running
         """
 
         self.base_url = urljoin(host, _API_PREFIX)
@@ -66,6 +125,37 @@ class FetchFox:
             'Authorization': f'Bearer: {self.api_key}'
         }
 
+        self._transport = PooledTransport(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            idle_timeout=idle_timeout)
+
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.incremental_results = incremental_results
+        self.trace_max_chars = trace_max_chars
+        self.trace_size_only = trace_size_only
+        self.response_hook = response_hook
+        self.stream_status = stream_status
+        self._registration_cache = RegistrationCache(
+            max_size=workflow_cache_size, path=workflow_cache_path)
+        self._result_cache = result_cache
+        self.reference_results = reference_results
+        self.shard_size = shard_size
+        self.shard_concurrency = shard_concurrency
+        self.rate_limiter = rate_limiter
+        self.stop_abandoned_jobs = stop_abandoned_jobs
+        self._job_slots = {}
+        self._job_slots_lock = threading.Lock()
+        self.poll_min_interval = poll_min_interval
+        self.poll_max_interval = poll_max_interval
+        self._retry_lock = threading.Lock()
+        self._retry_counts = {
+            "retries": 0,
+            "backoff_seconds": 0.0,
+            "gave_up": 0,
+        }
+
         # Convert log_level argument to a logging constant
         if isinstance(log_level, str):
             log_level = self._LOG_LEVELS.get(log_level.lower(), logging.WARNING)
@@ -85,9 +175,20 @@ class FetchFox:
             ch.setFormatter(formatter)
             self.logger.addHandler(ch)
 
-        self._executor = ThreadPoolExecutor(max_workers=1)
-        # TODO: this needs to be changed to support concurrent job polling,
-        # but I am setting it to 1 right now as a sanity-check
+        if executor is not None:
+            self._executor = executor
+            self._owns_executor = False
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="fetchfox")
+            self._owns_executor = True
+        self._pending_slots = (
+            threading.BoundedSemaphore(max_pending) if max_pending else None)
+        self._closed = False
+
+        self._watcher = None
+        if job_watcher:
+            self._watcher = JobWatcher(self, max_concurrency=watcher_concurrency)
 
         self._attached_jobs = []
         try:
@@ -96,6 +197,52 @@ class FetchFox:
             # If we're not in the main thread, we can't do this --e.g. flask req
             pass
 
+    def _submit(self, fn, *args, **kwargs) -> Future:
+        """Run fn in this client's executor.  If max_pending tasks are
+        already queued or running, block until one of them finishes."""
+        if self._closed:
+            raise RuntimeError("This FetchFox client has been closed.")
+
+        if self._pending_slots is not None:
+            self._pending_slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            if self._pending_slots is not None:
+                self._pending_slots.release()
+            raise
+
+        if self._pending_slots is not None:
+            future.add_done_callback(lambda _: self._pending_slots.release())
+        return future
+
+    def close(self, wait: bool = True):
+        """Stop background work and release connections.
+
+        Jobs that are still running on the server are not stopped.  Pending
+        `results_future()` futures of jobs followed by the job watcher are
+        cancelled.
+
+        Args:
+            wait: wait for running background tasks to finish
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._watcher is not None:
+            self._watcher.close()
+        for job_id in list(self._job_slots):
+            self._job_finished(job_id)
+        if self._owns_executor:
+            self._executor.shutdown(wait=wait)
+        self._transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def _handle_signit(self, sig, frame):
         """
         On Ctrl-c, abort any attached jobs (not touching detached jobs)
@@ -109,8 +256,131 @@ class FetchFox:
         sys.exit(1)
 
 
+    def _send(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send one API call, retrying according to `self.retry_policy`.
+        Returns the successful response; raises the last error otherwise.
+        """
+        url = urljoin(self.base_url, path)
+        kwargs.setdefault("timeout", (30,30))
+
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            wait = self._rate_limit_wait()
+            if wait:
+                time.sleep(wait)
+            try:
+                response = self._transport.request(
+                    method, url, headers=self.headers, **kwargs)
+                response.raise_for_status()
+                self._rate_limit_result()
+                return response
+            except requests.exceptions.RequestException as e:
+                self._rate_limit_result(e)
+                delay = self._retry_delay(method, path, attempt, e, started)
+                if delay is None:
+                    raise
+                if getattr(e, "response", None) is not None:
+                    # Streamed, it would keep its connection until closed
+                    e.response.close()
+                time.sleep(delay)
+                attempt += 1
+
+    def _retry_delay(self, method, path, attempt, error, started):
+        """Seconds to wait before retrying a failed call, according to
+        `self.retry_policy`, or None to give up.  Counts the retry."""
+        delay = self.retry_policy.get_delay(
+            method, attempt, error, time.monotonic() - started)
+        if delay is None:
+            if attempt > 0:
+                with self._retry_lock:
+                    self._retry_counts["gave_up"] += 1
+            return None
+
+        with self._retry_lock:
+            self._retry_counts["retries"] += 1
+            self._retry_counts["backoff_seconds"] += delay
+        self.logger.info(
+            "Retrying %s %s in %.2fs after: %s", method, path, delay, error)
+        return delay
+
+    def _rate_limit_wait(self) -> float:
+        """Seconds to wait before sending a request, per the rate limiter."""
+        if self.rate_limiter is None:
+            return 0.0
+        return self.rate_limiter.reserve()
+
+    def _rate_limit_result(self, error: Optional[Exception] = None):
+        """Tell the rate limiter how a request went."""
+        if self.rate_limiter is None:
+            return
+        response = getattr(error, "response", None)
+        if error is None:
+            self.rate_limiter.succeeded()
+        elif response is not None and response.status_code == 429:
+            self.rate_limiter.throttled(retry_after_seconds(response))
+            self.logger.info("Rate limited; slowing down to %.2f requests/s",
+                self.rate_limiter.current_rate)
+
+    def _acquire_job_slot(self):
+        if self.rate_limiter is None:
+            return None
+        return self.rate_limiter.acquire_job()
+
+    def _try_acquire_job_slot(self):
+        """Like _acquire_job_slot, but never waits.  Returns False if there
+        was no free slot."""
+        if self.rate_limiter is None:
+            return None
+        slot = self.rate_limiter.acquire_job(block=False)
+        return False if slot is None else slot
+
+    def _release_job_slot(self, slot):
+        if slot is not None and slot is not False:
+            self.rate_limiter.release_job(slot)
+
+    def _job_started(self, job_id: str, slot):
+        if slot is not None:
+            with self._job_slots_lock:
+                self._job_slots[job_id] = slot
+
+    def _job_finished(self, job_id: str):
+        """Give back the rate limiter's job slot held by this job, if any."""
+        with self._job_slots_lock:
+            slot = self._job_slots.pop(job_id, None)
+        self._release_job_slot(slot)
+
+    def _job_done(self, job_id: str):
+        """The job is no longer running on the server."""
+        try:
+            self._attached_jobs.remove(job_id)
+        except ValueError:
+            pass
+        self._job_finished(job_id)
+
+    def _stop_job(self, job_id: str) -> bool:
+        """Stop a running job started by this client, e.g. because nobody
+        wants the rest of its results, and stop polling it.  Failures are
+        logged, not raised.
+
+        Returns:
+            False if the job wasn't running (or was detached)
+        """
+        if job_id not in self._attached_jobs:
+            return False
+        try:
+            self._request("POST", f"jobs/{job_id}/stop")
+            self.logger.info("Stopped job: %s", job_id)
+        except requests.exceptions.RequestException as e:
+            self.logger.warning("Failed to stop job [%s]: %s", job_id, e)
+        self._job_done(job_id)
+        if self._watcher is not None:
+            self._watcher.unwatch(job_id)
+        return True
+
     def _request(self, method: str, path: str, json_data: Optional[dict] = None,
-                    params: Optional[dict] = None) -> dict:
+                    params: Optional[dict] = None,
+                    body: Optional[str] = None) -> dict:
         """Make an API request.
 
         Args:
@@ -118,28 +388,71 @@ class FetchFox:
             path: API path
             json_data: Optional JSON body
             params: Optional query string parameters
+            body: Optional JSON body, already encoded
         """
-        url = urljoin(self.base_url, path)
+        if body is not None:
+            response = self._send(
+                method, path, data=body.encode("utf-8"), params=params)
+        else:
+            response = self._send(method, path, json=json_data, params=params)
+        body = response.json()
 
-        response = requests.request(
-            method,
-            url,
-            headers=self.headers,
-            json=json_data,
-            params=params,
-            timeout=(30,30)
-        )
+        self._log_response(method, path, response, body)
+        return body
 
-        response.raise_for_status()
-        body = response.json()
+    def _log_response(self, method, path, response, body):
+        """Instrumentation for API responses.  Nothing is formatted unless a
+        response_hook is set or the logger is enabled for TRACE."""
+        if self.response_hook is not None:
+            self.response_hook(method, path, response, body)
+
+        if not self.logger.isEnabledFor(TRACE):
+            return
 
-        per_page='many'
+        if self.trace_size_only:
+            try:
+                size = len(response.content)
+            except RuntimeError:
+                # A streamed body which has already been consumed
+                size = response.headers.get('Content-Length', '?')
+            self.logger.trace(
+                "Response from %s %s: %s bytes  at %s",
+                method, path, size, datetime.now())
+            return
+
+        text = pformat(body)
+        if (self.trace_max_chars is not None
+                and len(text) > self.trace_max_chars):
+            text = (
+                text[:self.trace_max_chars]
+                + f"... [{len(text) - self.trace_max_chars} more chars]")
         self.logger.trace(
-            f"Response from %s %s:\n%s  at %s",
-            method, path, pformat(body), datetime.now())
-        return body
+            "Response from %s %s:\n%s  at %s",
+            method, path, text, datetime.now())
+
+    def retry_stats(self) -> dict:
+        """Counters for retried API calls made by this client.
 
-    def _workflow(self, url_or_urls: Union[str, List[str]] = None) -> "Workflow":
+        Returns:
+            A dict with `retries` (number of retried attempts),
+            `backoff_seconds` (total time spent waiting before retries) and
+            `gave_up` (calls that failed after at least one retry).
+        """
+        with self._retry_lock:
+            return dict(self._retry_counts)
+
+    def pool_stats(self) -> dict:
+        """Connection pool statistics for this client, e.g. to check that
+        connections are being reused under load.
+
+        Returns:
+            A dict with `requests`, `connections_opened`, `connections_reused`,
+            `in_flight`, `sessions_created` and `idle_evictions` counters.
+        """
+        return self._transport.stats()
+
+    def _workflow(self, url_or_urls: Union[str, List[str]] = None,
+            params: Optional[dict] = None) -> "Workflow":
         """Create a new workflow using this SDK instance.
 
         Examples of how to use a workflow:
@@ -211,8 +524,8 @@ class FetchFox:
         w = Workflow(self)
         if url_or_urls:
             w = w.init(url_or_urls)
-        # if params:
-        #     w = w.configure_params(params)
+        if params:
+            w = w.configure_params(params)
 
         return w
 
@@ -252,13 +565,55 @@ class FetchFox:
         Returns:
             Workflow ID
         """
-        response = self._request('POST', 'workflows', workflow.to_dict())
+        if self.reference_results and workflow._has_result_references():
+            try:
+                response = self._request('POST', 'workflows',
+                    body=workflow.to_json(reference=True))
+                return response['id']
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code not in (400, 422):
+                    raise
+                self._no_result_references()
+
+        response = self._request('POST', 'workflows', body=workflow.to_json())
 
         # NOTE: If we need to return anything else here, we should keep this
         # default behavior, but add an optional kwarg so "full_response=True"
         # can be supplied, and then we return everything
         return response['id']
 
+    def _no_result_references(self):
+        self.logger.info(
+            "The server doesn't accept references to job results.  "
+            "Sending the results instead.")
+        self.reference_results = False
+
+    def _workflow_digest(self, workflow: Workflow) -> str:
+        # Workflow IDs only make sense for the host and account they came from
+        namespace = self.base_url + "\n" + hashlib.sha256(
+            self.api_key.encode("utf-8")).hexdigest()
+        # Results from other workflows are hashed once, not re-encoded
+        return workflow_digest(
+            workflow._map_snapshots(lambda snapshot: {"digest": snapshot.digest}),
+            namespace=namespace)
+
+    def _register_workflow_cached(self, workflow: Workflow):
+        """Register a workflow, unless an identical one was registered before.
+
+        Returns:
+            (workflow ID, whether it came from the registration cache)
+        """
+        digest = self._workflow_digest(workflow)
+        workflow_id = self._registration_cache.get(digest)
+        if workflow_id is not None:
+            self.logger.debug("Reusing registered workflow: %s", workflow_id)
+            return workflow_id, True
+
+        workflow_id = self._register_workflow(workflow)
+        self.logger.info("Registered new workflow with id: %s", workflow_id)
+        self._registration_cache.put(digest, workflow_id)
+        return workflow_id, False
+
     def _get_workflows(self) -> list:
         """Get workflows
 
@@ -302,6 +657,8 @@ class FetchFox:
             wait: use wait=False to get an immediate response, which will either be the full results or None if the job is not yet complete.
         Returns:
             The full results of the job.  Or, if wait=False and the job is not done, None.
+
+        To get the results as they arrive instead, see `stream_job()`.
         """
 
         if wait:
@@ -325,29 +682,92 @@ class FetchFox:
 
                 return [ Item(result) for result in results ]
 
+    def _stream_progress(self, job_id, cursor, seen_ids) -> JobProgress:
+        progress = self._new_job_progress(job_id)
+        if progress.incremental:
+            progress.cursor = cursor
+        progress.seen_ids.update(seen_ids or ())
+        return progress
 
-    def _run_workflow(self, workflow_id: Optional[str] = None,
-                    workflow: Optional[Workflow] = None, detached=False,
-                    params: Optional[dict] = None) -> str:
-        """Run a workflow. Either provide the ID of a registered workflow,
-        or provide a workflow object (which will be registered
-        automatically, for convenience).
+    def stream_job(self, job_id: str, cursor: Optional[str] = None,
+            seen_ids: Optional[Iterable[str]] = None,
+            poll_min_interval: Optional[float] = None,
+            poll_max_interval: Optional[float] = None) -> JobStream:
+        """Follow a running job, e.g. one from `run_detached()`, and iterate
+        over its results as they arrive.  Results are not kept in memory.
 
-        You can browse https://fetchfox.ai to find publicly available workflows
-        authored by others.  Copy the workflow ID and use it here.  Often,
-        in this case, you will also want to provide parameters.
+        ```
+        stream = fox.stream_job(job_id)
+        for item in stream:
+            save(item)
+        ```
+
+        To continue later, or in another process, keep `stream.state()`
+        (the job ID, a cursor and the IDs of the items seen so far) and pass
+        it back in: `fox.stream_job(**state)`.  Only the items which weren't
+        yielded before are yielded then.
+
+        Closing the stream, or breaking out of the loop, leaves the job
+        running.
 
         Args:
-            workflow_id: ID of an existing workflow to run
-            workflow: A Workflow object to register and run
-            params: Optional parameters for the workflow
+            job_id: ID of the job
+            cursor: continue after this cursor, from a previous stream's `cursor`
+            seen_ids: skip items with these `_meta.id`s, e.g. a previous stream's `seen_ids`
+            poll_min_interval: override this client's poll intervals for this job
+            poll_max_interval: override this client's poll intervals for this job
+        """
+        progress = self._stream_progress(job_id, cursor, seen_ids)
+        return JobStream(progress, self._job_result_items_gen(
+            job_id, progress=progress,
+            poll_min_interval=poll_min_interval,
+            poll_max_interval=poll_max_interval))
 
-        Returns:
-            Job ID
+    def map(self, workflow: Workflow, inputs: Iterable[dict],
+            concurrency: int = 8, ordered: bool = False):
+        """Run one workflow for each of many sets of parameters, and yield
+        all of their results.
 
-        Raises:
-            ValueError: If neither workflow_id nor workflow is provided
+        The workflow is registered once, and then run once per input, with
+        at most `concurrency` jobs running at a time.  Each result is
+        yielded along with the input it came from:
+
+        ```
+        stores = fox.workflow_by_id(ID)
+        for params, item in fox.map(stores, [{"state": s} for s in states]):
+            print(params["state"], item.name)
+        ```
+
+        Args:
+            workflow: the workflow to run.  Parameters configured on it are used for every run, unless an input overrides them.
+            inputs: dictionaries of parameters, one per run
+            concurrency: max jobs running at once
+            ordered: yield results in input order.  By default, they are yielded as soon as they arrive from any job.
+        Yields:
+            (input, Item) pairs
         """
+        inputs = [dict(params) for params in inputs]
+        if not inputs:
+            return
+
+        workflow_id, _ = self._register_workflow_cached(workflow)
+        run = ShardedRun(self, inputs,
+            max_concurrency=concurrency,
+            ordered=ordered,
+            stream_kwargs=workflow._job_stream_kwargs(),
+            start_job=lambda params, job_slot: self._run_workflow(
+                workflow_id=workflow_id,
+                params=dict(workflow._params or {}, **params),
+                job_slot=job_slot))
+        try:
+            for index, item in run.tagged():
+                yield inputs[index], Item(item)
+        finally:
+            run.close(stop_jobs=self.stop_abandoned_jobs)
+
+
+    def _check_run_workflow_args(self, workflow_id, workflow, params):
+        """Validate the arguments of _run_workflow (and its async twin)."""
         if workflow_id is None and workflow is None:
             raise ValueError(
                 "Either workflow_id or workflow must be provided")
@@ -364,30 +784,73 @@ class FetchFox:
                 "The workflow_id argument must be a string "
                 "representing a registered workflow's ID")
 
-        if params is not None:
-            raise NotImplementedError("Cannot pass params to workflows yet")
-            # TODO:
-            #   It sounds like these might be passed in the const/init step?
-            #   Or, maybe they need to go in as a dictionary on the side?
-            # TODO:
-            #   https://docs.google.com/document/d/17ieru_HfU3jXBilcZqL1Ksf27rsVPvOIQ8uxmHi2aeE/edit?disco=AAABdjyFjgw
-            #   allow list-expansion here like above, pretty cool
-
-        if workflow_id is None:
-            workflow_id = self._register_workflow(workflow) # type: ignore
-            self.logger.info("Registered new workflow with id: %s", workflow_id)
-
-        #response = self._request('POST', f'workflows/{workflow_id}/run', params or {})
-        response = self._request('POST', f'workflows/{workflow_id}/run')
+        if params is not None and not isinstance(params, dict):
+            raise ValueError("params must be a dictionary")
+
+    def _run_body(self, workflow, params) -> Optional[dict]:
+        """Request body for running a workflow, with its parameters."""
+        if params is None and workflow is not None:
+            params = workflow._params
+        return {"params": params} if params else None
+
+    def _run_workflow(self, workflow_id: Optional[str] = None,
+                    workflow: Optional[Workflow] = None, detached=False,
+                    params: Optional[dict] = None, job_slot=None) -> str:
+        """Run a workflow. Either provide the ID of a registered workflow,
+        or provide a workflow object (which will be registered
+        automatically, for convenience).
+
+        You can browse https://fetchfox.ai to find publicly available workflows
+        authored by others.  Copy the workflow ID and use it here.  Often,
+        in this case, you will also want to provide parameters.
+
+        Args:
+            workflow_id: ID of an existing workflow to run
+            workflow: A Workflow object to register and run
+            params: Optional parameters for the workflow.  By default, those of `workflow.configure_params()`.
+            job_slot: a slot from the rate limiter's `acquire_job()` which the caller already holds for this job.  By default, one is acquired here, waiting if needed.
+
+        Returns:
+            Job ID
+
+        Raises:
+            ValueError: If neither workflow_id nor workflow is provided
+        """
+        self._check_run_workflow_args(workflow_id, workflow, params)
+        body = self._run_body(workflow, params)
+
+        slot = job_slot
+        if slot is None and not detached:
+            slot = self._acquire_job_slot()
+        try:
+            cached = False
+            if workflow_id is None:
+                workflow_id, cached = self._register_workflow_cached(workflow) # type: ignore
+
+            try:
+                response = self._request('POST', f'workflows/{workflow_id}/run', body)
+            except requests.exceptions.HTTPError as e:
+                if not (cached and e.response is not None
+                        and e.response.status_code == 404):
+                    raise
+                # The cached workflow is gone from the server: register again
+                self.logger.info("Cached workflow %s no longer exists", workflow_id)
+                self._registration_cache.invalidate(self._workflow_digest(workflow))
+                workflow_id, _ = self._register_workflow_cached(workflow) # type: ignore
+                response = self._request('POST', f'workflows/{workflow_id}/run', body)
+        except BaseException:
+            self._release_job_slot(slot)
+            raise
         if not detached:
             self._attached_jobs.append(response['jobId'])
+            self._job_started(response['jobId'], slot)
 
         # NOTE: If we need to return anything else here, we should keep this
         # default behavior, but add an optional kwarg so "full_response=True"
         # can be supplied, and then we return everything
         return response['jobId']
 
-    def _get_job_status(self, job_id: str) -> dict:
+    def _get_job_status(self, job_id: str, params: Optional[dict] = None) -> dict:
         """Get the status and results of a job.  Returns partial results before
         eventually returning the full results.
 
@@ -400,22 +863,63 @@ class FetchFox:
         NOTE: Jobs are not created immediately after you call run_workflow().
         The status will not be available until the job is scheduled, so this
         will 404 initially.
-        """
-        return self._request('GET', f'jobs/{job_id}')
 
-    def _poll_status_once(self, job_id, detached_skip_wait=False):
+        Args:
+            job_id: the job to query
+            params: optional query string, e.g. from JobProgress.poll_params()
+        """
+        return self._request('GET', f'jobs/{job_id}', params=params)
+
+    def _poll_scheduler(self, min_interval: Optional[float] = None,
+            max_interval: Optional[float] = None) -> PollScheduler:
+        """A PollScheduler using this client's intervals, unless overridden."""
+        return PollScheduler(
+            min_interval=(
+                self.poll_min_interval if min_interval is None else min_interval),
+            max_interval=(
+                self.poll_max_interval if max_interval is None else max_interval))
+
+    def _poll_status_once(self, job_id, detached_skip_wait=False,
+            progress: Optional[JobProgress] = None,
+            scheduler: Optional[PollScheduler] = None,
+            stream: bool = False):
         """Poll until we get one status response.  This may be more than one poll,
         if it is the first one, since the job will 404 for a while before
-        it is scheduled."""
+        it is scheduled.  Those repeated polls back off according to the
+        scheduler.
+
+        If a JobProgress is given, its cursor is sent so that an incremental
+        status is returned, when the server supports it.
+
+        With stream=True, the undecoded (streamed) requests.Response is
+        returned instead of the decoded status; the caller must close it."""
         MAX_WAIT_FOR_JOB_ALIVE_MINUTES = 5 #TODO: reasonable?
+        if scheduler is None:
+            scheduler = self._poll_scheduler()
         started_waiting_for_job_dt = None
         while True:
+            params = progress.poll_params() if progress is not None else None
             try:
-                status = self._get_job_status(job_id)
+                if stream:
+                    status = self._send(
+                        'GET', f'jobs/{job_id}', params=params, stream=True)
+                else:
+                    status = self._get_job_status(job_id, params=params)
                 sys.stdout.flush()
 
                 return status
             except requests.exceptions.HTTPError as e:
+                if stream:
+                    # Give its connection back to the pool
+                    e.response.close()
+                if params is not None and e.response.status_code == 400:
+                    # Server doesn't understand our poll parameters
+                    self.logger.debug(
+                        "Status parameters rejected for job %s, "
+                        "falling back to full polls", job_id)
+                    progress.fall_back()
+                    continue
+
                 if detached_skip_wait:
                     return None
 
@@ -431,6 +935,9 @@ class FetchFox:
                             raise RuntimeError(
                                 f"Job {job_id} is taking unusually long to schedule.")
 
+                    time.sleep(scheduler.unscheduled(
+                        hint=retry_after_seconds(e.response)))
+
                 else:
                     raise
 
@@ -438,18 +945,184 @@ class FetchFox:
         # TODO: cleanup?
         return item
 
-    def _job_result_items_gen(self, job_id,
+    def _consume_job_status(self, progress: JobProgress, response: dict,
+            raw_log_level=logging.ERROR,
+            log_summaries_dest=None,
+            intermediate_items_dest=None) -> Optional[list]:
+        """Take one status response for a job and return the result items
+        which have not been seen before.  Logs and intermediate items are
+        forwarded / appended to the given destinations.
+
+        Returns None if the response carries no result items at all yet.
+        """
+        progress.update(response)
+        if progress.done:
+            self._job_done(progress.job_id)
+        results = response.get('results') or {}
+
+        try:
+            if log_summaries_dest is not None:
+                logs_summaries = results['logs']['tail']
+                for log_summary_line in logs_summaries:
+                    key = (
+                        log_summary_line['timestamp'],
+                        log_summary_line['message']
+                    )
+                    if key not in progress.seen_log_summaries:
+                        log_summaries_dest.append(key)
+                        progress.seen_log_summaries.add(key)
+        except KeyError:
+            pass
+
+        try:
+            logs = results['logs']['raw']
+            for log_line in logs:
+                key = (
+                    log_line['timestamp'],
+                    log_line['level'],
+                    log_line['message']
+                )
+                if key not in progress.seen_logs:
+                    level_constant = self._LOG_LEVELS[log_line['level']]
+                    newmsg = f"[SERVER] {log_line['message']}"
+                    progress.seen_logs.add(key)
+                    if level_constant >= raw_log_level:
+                        self.logger.log(level_constant, newmsg)
+        except KeyError:
+            pass
+
+        try:
+            if intermediate_items_dest is not None:
+                for step_items in results['full']:
+                    for intermediate_item in step_items['items']:
+                        ii_id = intermediate_item['_meta']['id']
+                        if ii_id not in progress.seen_intermediate_item_ids:
+                            progress.seen_intermediate_item_ids.add(ii_id)
+                            intermediate_items_dest.append(intermediate_item)
+        except KeyError:
+            pass
+
+        # We are considering only the result_items here, not partials
+        if 'items' not in results:
+            return None
+
+        new_items = []
+        for job_result_item in results['items']:
+            item = self._new_result_item(progress, job_result_item)
+            if item is not None:
+                new_items.append(item)
+        return new_items
+
+    def _new_result_item(self, progress: JobProgress, job_result_item):
+        """Return the cleaned up item if it hasn't been seen yet, else None."""
+        jri_id = job_result_item['_meta']['id']
+        if jri_id in progress.seen_ids:
+            return None
+        progress.seen_ids.add(jri_id)
+        return self._cleanup_job_result_item(job_result_item)
+
+    def _status_sections_to_skip(self, raw_log_level, log_summaries_dest,
+            intermediate_items_dest) -> list:
+        """Sections of the job status nobody will look at."""
+        skip = []
+        if intermediate_items_dest is None:
+            skip.append(INTERMEDIATE_PREFIX)
+        if log_summaries_dest is None:
+            skip.append(LOG_SUMMARIES_PREFIX)
+        if (raw_log_level > logging.CRITICAL
+                or not self.logger.isEnabledFor(logging.CRITICAL)):
+            # No server log line could pass the level checks
+            skip.append(RAW_LOGS_PREFIX)
+        return skip
+
+    def _new_job_progress(self, job_id, raw_log_level=logging.ERROR,
+            log_summaries_dest=None, intermediate_items_dest=None) -> JobProgress:
+        """A JobProgress asking the server to leave out whatever sections of
+        the status the caller doesn't need."""
+        skip = self._status_sections_to_skip(
+            raw_log_level, log_summaries_dest, intermediate_items_dest)
+        exclude = []
+        if INTERMEDIATE_PREFIX in skip:
+            exclude.append("full")
+        if LOG_SUMMARIES_PREFIX in skip and RAW_LOGS_PREFIX in skip:
+            exclude.append("logs")
+        return JobProgress(
+            job_id, incremental=self.incremental_results, exclude=exclude)
+
+    def _poll_job_once(self, job_id, progress, scheduler,
             raw_log_level=logging.ERROR,
             log_summaries_dest=None,
             intermediate_items_dest=None):
+        """Get one status of the job, yielding its new result items.
+
+        With `stream_status` enabled (and ijson installed), the status is
+        decoded incrementally: items are yielded as they are parsed, and
+        sections nobody asked for are never decoded.
+
+        Returns (status, had_items): the status document (without the
+        streamed items), and whether it had a results.items list at all.
+        """
+        if self.stream_status and streaming_available():
+            skip = self._status_sections_to_skip(
+                raw_log_level, log_summaries_dest, intermediate_items_dest)
+            started = time.monotonic()
+            attempt = 0
+            while True:
+                response = self._poll_status_once(
+                    job_id, progress=progress, scheduler=scheduler, stream=True)
+                status = {}
+                try:
+                    response.raw.decode_content = True
+                    for kind, value in iter_job_status(response.raw, skip=skip):
+                        if kind == "item":
+                            item = self._new_result_item(progress, value)
+                            if item is not None:
+                                yield item
+                        else:
+                            status = value
+                    break
+                except (urllib3.exceptions.HTTPError,) + DECODE_ERRORS as e:
+                    # The body was cut short: poll again.  The items we
+                    # already yielded are skipped, as they were seen.
+                    error = requests.exceptions.ChunkedEncodingError(e)
+                    delay = self._retry_delay(
+                        "GET", f"jobs/{job_id}", attempt, error, started)
+                    if delay is None:
+                        raise error from e
+                    time.sleep(delay)
+                    attempt += 1
+                finally:
+                    response.close()
+            self._log_response("GET", f"jobs/{job_id}", response, status)
+        else:
+            status = self._poll_status_once(
+                job_id, progress=progress, scheduler=scheduler)
+
+        new_items = self._consume_job_status(
+            progress, status,
+            raw_log_level=raw_log_level,
+            log_summaries_dest=log_summaries_dest,
+            intermediate_items_dest=intermediate_items_dest)
+        if new_items:
+            yield from new_items
+        return status, new_items is not None
+
+    def _job_result_items_gen(self, job_id,
+            raw_log_level=logging.ERROR,
+            log_summaries_dest=None,
+            intermediate_items_dest=None,
+            progress: Optional[JobProgress] = None,
+            poll_min_interval: Optional[float] = None,
+            poll_max_interval: Optional[float] = None):
         """Yield new result items as they arrive.
-        Log_summaries_dest can be a list that accumulates logs"""
+        Log_summaries_dest can be a list that accumulates logs.
+        The poll intervals override this client's defaults for this job."""
         self.logger.info(f"Streaming results from: [{job_id}]: ")
 
-        seen_ids = set() # We need to track which have been yielded already
-        seen_log_summaries = set()
-        seen_logs = set()
-        seen_intermediate_item_ids = set()
+        if progress is None:
+            progress = self._new_job_progress(
+                job_id, raw_log_level, log_summaries_dest, intermediate_items_dest)
+        scheduler = self._poll_scheduler(poll_min_interval, poll_max_interval)
 
         MAX_WAIT_FOR_CHANGE_MINUTES = 5
         # Job will be assumed done/stalled after this much time passes without
@@ -457,81 +1130,48 @@ class FetchFox:
         first_response_dt = None
         results_changed_dt = None
 
-        while True:
-            response = self._poll_status_once(job_id)
-            # The above will block until we get one successful response
-            if not first_response_dt:
-                first_response_dt = datetime.now()
-
-            try:
-                if log_summaries_dest is not None:
-                    logs_summaries = response['results']['logs']['tail']
-                    for log_summary_line in logs_summaries:
-                        key = (
-                            log_summary_line['timestamp'],
-                            log_summary_line['message']
-                        )
-                        if key not in seen_log_summaries:
-                            log_summaries_dest.append(key)
-                            seen_log_summaries.add(key)
-            except KeyError:
-                pass
+        try:
+            while True:
+                seen_before = len(progress.seen_ids)
+                response, had_items = yield from self._poll_job_once(
+                    job_id, progress, scheduler,
+                    raw_log_level=raw_log_level,
+                    log_summaries_dest=log_summaries_dest,
+                    intermediate_items_dest=intermediate_items_dest)
+                # The above will block until we get one successful response
+                new_count = len(progress.seen_ids) - seen_before
+                if not first_response_dt:
+                    first_response_dt = datetime.now()
+
+                if not had_items:
+                    waited_dur = datetime.now() - first_response_dt
+                    if waited_dur > timedelta(minutes=MAX_WAIT_FOR_CHANGE_MINUTES):
+                        raise RuntimeError(
+                            "This job is taking too long - please retry.")
+                    if progress.done:
+                        break
+                    time.sleep(scheduler.next_delay(
+                        0, hint=response.get('pollInterval')))
+                    continue
+
+                if new_count:
+                    # We have new result_items
+                    results_changed_dt = datetime.now()
 
-            try:
-                logs = response['results']['logs']['raw']
-                for log_line in logs:
-                    key = (
-                        log_line['timestamp'],
-                        log_line['level'],
-                        log_line['message']
-                    )
-                    if key not in seen_logs:
-                        level_constant = self._LOG_LEVELS[log_line['level']]
-                        newmsg = f"[SERVER] {log_line['message']}"
-                        seen_logs.add(key)
-                        if level_constant >= raw_log_level:
-                            self.logger.log(level_constant, newmsg)
-            except KeyError:
-                pass
+                if results_changed_dt:
+                    waited_dur2 = results_changed_dt - datetime.now()
+                    if waited_dur2 > timedelta(minutes=MAX_WAIT_FOR_CHANGE_MINUTES):
+                        # It has been too long since we've seen a new result, so
+                        # we will assume the job is stalled on the server
+                        break
 
-            try:
-                if intermediate_items_dest is not None:
-                    for step_items in response['results']['full']:
-                        for intermediate_item in step_items['items']:
-                            ii_id = intermediate_item['_meta']['id']
-                            if ii_id not in seen_intermediate_item_ids:
-                                seen_intermediate_item_ids.add(ii_id)
-                                intermediate_items_dest.append(intermediate_item)
-            except KeyError:
-                continue
-
-            # We are considering only the result_items here, not partials
-            if 'items' not in response['results']:
-                waited_dur = datetime.now() - first_response_dt
-                if waited_dur > timedelta(minutes=MAX_WAIT_FOR_CHANGE_MINUTES):
-                    raise RuntimeError(
-                        "This job is taking too long - please retry.")
-                continue
-
-            for job_result_item in response['results']['items']:
-                jri_id = job_result_item['_meta']['id']
-                if jri_id not in seen_ids:
-                    # We have a new result_item
-                    results_changed_dt = datetime.now()
-                    seen_ids.add(jri_id)
-                    yield self._cleanup_job_result_item(job_result_item)
-
-            if results_changed_dt:
-                waited_dur2 = results_changed_dt - datetime.now()
-                if waited_dur2 > timedelta(minutes=MAX_WAIT_FOR_CHANGE_MINUTES):
-                    # It has been too long since we've seen a new result, so
-                    # we will assume the job is stalled on the server
+                if progress.done:
                     break
 
-            if response.get("done") == True:
-                break
-
-            time.sleep(1)
+                time.sleep(scheduler.next_delay(
+                    new_count, hint=response.get('pollInterval')))
+        finally:
+            self._job_finished(job_id)
 
     def extract(self, url_or_urls, *args, **kwargs):
         """Extract items from a given URL, given an item template.
@@ -0,0 +1,576 @@
+import csv
+import gzip
+import io
+import json
+import os
+import time
+from typing import Callable, Iterable, List, Optional
+
+try:
+    import orjson
+except ImportError: # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import zstandard
+except ImportError: # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError: # pragma: no cover - optional dependency
+    pyarrow = None
+
+from .cache import create_temp_file
+
+
+COMPRESSIONS = {
+    ".gz": "gzip",
+    ".zst": "zstd",
+}
+
+
+def _json_line(item) -> bytes:
+    """Encode one item as a line of compact JSON, with orjson if installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            pass # e.g. non-string keys, which json handles
+    return (json.dumps(item, separators=(",", ":"), ensure_ascii=False)
+        + "\n").encode("utf-8")
+
+
+class ExportWriter:
+    """Writes result items to a file one at a time, so an export never has to
+    hold all the results.
+
+    The file is written under a temporary name, and only renamed to
+    `filename` once it is complete, so an interrupted export never leaves a
+    truncated file behind.  Output is buffered and written in chunks of
+    about `buffer_size` bytes, and may be compressed with gzip or zstandard
+    (`codec`).
+
+    Use as a context manager, or call `close()`, which returns export stats.
+    """
+
+    format = None
+    extension = None
+    needs_fieldnames = False
+    compressible = True
+    appendable = True
+
+    def __init__(self, filename: str, codec: Optional[str] = None,
+            compresslevel: Optional[int] = None,
+            buffer_size: int = 256 * 1024,
+            flush_interval: float = 1.0,
+            path: Optional[str] = None,
+            offset: Optional[int] = None,
+            on_checkpoint: Optional[Callable] = None):
+        """
+        Args:
+            filename: the file to write
+            codec: None, "gzip" or "zstd"
+            compresslevel: compression level for the codec.  Defaults to 6 for gzip, 3 for zstd.
+            buffer_size: bytes to collect before writing them out
+            flush_interval: flush written items to disk at most this often, in seconds
+            path: write here, and rename it to `filename` when done.  Defaults to a temporary file next to `filename`.
+            offset: continue the partial file at `path` from this size, as given to `on_checkpoint`
+            on_checkpoint: called as on_checkpoint(offset, ids) whenever written items are flushed to disk, with the file size so far and the `_meta.id`s of the items written since the last call.  The file may later be continued from that offset.
+        """
+        if codec not in (None, *COMPRESSIONS.values()):
+            raise ValueError(f"Unknown compression codec: {codec}")
+        if codec == "zstd" and zstandard is None:
+            raise ImportError(
+                "Writing .zst files requires zstandard.  "
+                "Install it with: pip install fetchfox-sdk[zstd]")
+        if offset is not None and (path is None or not self.appendable):
+            raise ValueError(f"Can't continue a partial {self.format} file")
+        self.filename = filename
+        self.codec = codec
+        self.compresslevel = compresslevel
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.path = path
+        self.offset = offset
+        self.on_checkpoint = on_checkpoint
+        self.count = 0
+        self._raw = None
+        self._file = None
+        self._temporary = False
+        self._pending = []
+        self._pending_size = 0
+        self._unflushed_ids = []
+        self._last_flush = time.monotonic()
+
+    def _open_path(self) -> str:
+        if self.path is None:
+            directory, name = os.path.split(os.path.abspath(self.filename))
+            fd, self.path = create_temp_file(directory, f".{name}.", ".tmp")
+            os.close(fd)
+            self._temporary = True
+        return self.path
+
+    def _compressor(self):
+        if self.codec == "gzip":
+            level = 6 if self.compresslevel is None else self.compresslevel
+            return gzip.GzipFile(
+                fileobj=self._raw, mode='wb', compresslevel=level)
+        if self.codec == "zstd":
+            level = 3 if self.compresslevel is None else self.compresslevel
+            return zstandard.ZstdCompressor(level=level).stream_writer(
+                self._raw, closefd=False)
+        return self._raw
+
+    def open(self):
+        """Open the (possibly compressed) binary output stream."""
+        path = self._open_path()
+        if self.offset is not None:
+            # Drop anything written after the last checkpoint
+            self._raw = open(path, 'r+b')
+            self._raw.truncate(self.offset)
+            self._raw.seek(self.offset)
+        else:
+            self._raw = open(path, 'wb')
+        self._file = self._compressor()
+        return self
+
+    @property
+    def appending(self) -> bool:
+        return bool(self.offset)
+
+    def _write(self, item: dict):
+        raise NotImplementedError()
+
+    def _emit(self, data: bytes):
+        """Queue bytes for writing, writing them out in big chunks."""
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= self.buffer_size:
+            self._write_pending()
+
+    def _write_pending(self):
+        if self._pending:
+            self._file.write(b"".join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def write(self, item):
+        """Write one item: a dict or an Item."""
+        if self._file is None:
+            self.open()
+        item = dict(item)
+        if self.on_checkpoint is not None:
+            self._unflushed_ids.append(
+                (item.get("_meta") or {}).get("id"))
+        self._write(item)
+        self.count += 1
+
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self.flush()
+            self._last_flush = now
+
+    def write_all(self, items: Iterable):
+        for item in items:
+            self.write(item)
+
+    def _checkpoint(self) -> int:
+        """Complete the compressed data written so far, so the file could be
+        continued from here by appending a new gzip member / zstd frame.
+        Returns the size of the file at that point."""
+        if self.codec == "gzip":
+            self._file.close() # leaves self._raw open
+        elif self.codec == "zstd":
+            self._file.flush(zstandard.FLUSH_FRAME)
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        offset = self._raw.tell()
+        if self.codec == "gzip":
+            # The next member's header goes after the checkpoint
+            self._file = self._compressor()
+        return offset
+
+    def flush(self):
+        if self._file is None:
+            return
+        self._write_pending()
+        if self.on_checkpoint is not None:
+            offset = self._checkpoint()
+            ids, self._unflushed_ids = self._unflushed_ids, []
+            self.on_checkpoint(offset, ids)
+        else:
+            # Also flushes the compressor, so that what's written so far
+            # can be decompressed
+            self._file.flush()
+            self._raw.flush()
+
+    def stats(self) -> dict:
+        return {
+            "filename": self.filename,
+            "format": self.format,
+            "codec": self.codec,
+            "items": self.count,
+            "bytes": os.path.getsize(self.filename),
+        }
+
+    def _close_files(self):
+        for f in (self._file, self._raw):
+            if f is not None and not getattr(f, "closed", False):
+                f.close()
+
+    def close(self) -> dict:
+        if self._file is None:
+            self.open()
+        self._write_pending()
+        self._close_files()
+        os.replace(self.path, self.filename)
+        return self.stats()
+
+    def abort(self):
+        """Stop writing without producing `filename`.  A temporary file is
+        removed; a partial file at a given `path` is kept, to be continued."""
+        try:
+            if self._file is not None:
+                self._write_pending()
+                self._close_files()
+        finally:
+            if self._temporary:
+                try:
+                    os.unlink(self.path)
+                except OSError:
+                    pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class JsonlWriter(ExportWriter):
+    """One JSON object per line.  Encoded with orjson when it's installed."""
+
+    format = "jsonl"
+    extension = ".jsonl"
+
+    def _write(self, item):
+        self._emit(_json_line(item))
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["encoder"] = "orjson" if orjson is not None else "json"
+        return stats
+
+
+class CsvWriter(ExportWriter):
+    """CSV with a fixed header.
+
+    The header must be known before the first row is written, e.g. from the
+    item template of the workflow's extract step.  Fields of an item which
+    aren't in the header are not dropped: they are written as a JSON object
+    in the `extra_field` column.
+    """
+
+    format = "csv"
+    extension = ".csv"
+    needs_fieldnames = True
+
+    def __init__(self, filename: str, fieldnames: Iterable[str],
+            extra_field: Optional[str] = "_extra", **kwargs):
+        """
+        Args:
+            filename: the file to write
+            fieldnames: the CSV header
+            extra_field: name of the column for unexpected fields.  None to put every field in the header only.
+        """
+        super().__init__(filename, **kwargs)
+        self.fieldnames = list(fieldnames)
+        self.extra_field = extra_field
+        if extra_field is not None and extra_field in self.fieldnames:
+            self.extra_field = None
+        self._known = set(self.fieldnames)
+        self._buffer = io.StringIO()
+        header = self.fieldnames
+        if self.extra_field is not None:
+            header = header + [self.extra_field]
+        self._writer = csv.DictWriter(self._buffer, fieldnames=header, restval='')
+
+    def _emit_buffer(self):
+        self._emit(self._buffer.getvalue().encode("utf-8"))
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def open(self):
+        super().open()
+        if not self.appending:
+            self._writer.writeheader()
+            self._emit_buffer()
+        return self
+
+    def _write(self, item):
+        extra = None
+        if not self._known.issuperset(item):
+            extra = {k: item.pop(k) for k in list(item) if k not in self._known}
+        if extra and self.extra_field is not None:
+            item[self.extra_field] = json.dumps(extra)
+        self._writer.writerow(item)
+        self._emit_buffer()
+
+
+class _ArrowWriter(ExportWriter):
+    """Base for columnar formats, written with pyarrow.
+
+    Columns are the given fieldnames, typically the extract step's item
+    template, plus an `extra_field` column for any other fields, as with
+    CsvWriter.  Extracted values are text, so every column is a string
+    column; nested values are written as JSON.
+
+    Items are buffered and written in batches of `batch_size` rows (one
+    Parquet row group or Arrow record batch each).
+    """
+
+    needs_fieldnames = True
+    compressible = False # they compress internally
+    appendable = False
+    default_compression = "zstd"
+
+    def __init__(self, filename: str, fieldnames: Iterable[str],
+            extra_field: Optional[str] = "_extra",
+            batch_size: int = 10000, compression: Optional[str] = None,
+            **kwargs):
+        """
+        Args:
+            filename: the file to write
+            fieldnames: the columns
+            extra_field: name of the column for unexpected fields.  None to drop them.
+            batch_size: rows per row group / record batch
+            compression: codec name, e.g. "zstd", "lz4" or "snappy" (Parquet only).  Defaults to zstd.
+        """
+        if pyarrow is None:
+            raise ImportError(
+                f"Exporting to {self.extension} requires pyarrow.  "
+                "Install it with: pip install fetchfox-sdk[arrow]")
+        super().__init__(filename, **kwargs)
+        self.fieldnames = list(fieldnames)
+        if extra_field is not None and extra_field not in self.fieldnames:
+            self.columns = self.fieldnames + [extra_field]
+        else:
+            self.columns = self.fieldnames
+            extra_field = None
+        self.extra_field = extra_field
+        self.batch_size = batch_size
+        self.compression = compression or self.default_compression
+        self.schema = pyarrow.schema(
+            [(name, pyarrow.string()) for name in self.columns])
+        self._known = set(self.fieldnames)
+        self._batch = {name: [] for name in self.columns}
+        self._batched = 0
+
+    @staticmethod
+    def _text(value):
+        if value is None or isinstance(value, str):
+            return value
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        return str(value)
+
+    def _write(self, item):
+        for name in self.fieldnames:
+            self._batch[name].append(self._text(item.get(name)))
+        if self.extra_field is not None:
+            extra = {k: v for k, v in item.items() if k not in self._known}
+            self._batch[self.extra_field].append(
+                json.dumps(extra) if extra else None)
+        self._batched += 1
+        if self._batched >= self.batch_size:
+            self._write_batch()
+
+    def _write_batch(self):
+        if not self._batched:
+            return
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(self._batch[name], type=pyarrow.string())
+                for name in self.columns],
+            schema=self.schema)
+        self._file.write_batch(batch)
+        self._batch = {name: [] for name in self.columns}
+        self._batched = 0
+
+    def flush(self):
+        # Rows only go out in whole batches; small row groups are costly
+        pass
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["codec"] = self.compression
+        return stats
+
+    def close(self) -> dict:
+        if self._file is None:
+            self.open()
+        self._write_batch()
+        return super().close()
+
+
+class ParquetWriter(_ArrowWriter):
+    """Parquet, via pyarrow."""
+
+    format = "parquet"
+    extension = ".parquet"
+
+    def open(self):
+        self._file = pyarrow.parquet.ParquetWriter(
+            self._open_path(), self.schema, compression=self.compression)
+        return self
+
+
+class ArrowWriter(_ArrowWriter):
+    """Arrow IPC file format (also known as Feather v2), via pyarrow."""
+
+    format = "arrow"
+    extension = ".arrow"
+
+    def open(self):
+        self._raw = pyarrow.OSFile(self._open_path(), 'wb')
+        self._file = pyarrow.ipc.new_file(
+            self._raw, self.schema,
+            options=pyarrow.ipc.IpcWriteOptions(compression=self.compression))
+        return self
+
+
+class FeatherWriter(ArrowWriter):
+    format = "feather"
+    extension = ".feather"
+
+
+class ResumeLog:
+    """Append-only record of a resumable export's progress: the job being
+    exported, then one line per checkpoint with the size of the partial
+    file and the `_meta.id`s of the items written since the last one.
+
+    A line cut short by a crash is ignored, so the log always describes a
+    state of the partial file which was actually flushed to disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def load(self) -> Optional[dict]:
+        """The recorded state, as {"job_id", "workflow", "offset", "ids"},
+        or None if there is nothing to resume."""
+        try:
+            with open(self.path, 'rb') as f:
+                lines = f.read().split(b"\n")
+        except OSError:
+            return None
+
+        try:
+            state = json.loads(lines[0])
+        except ValueError:
+            return None
+        state["offset"] = 0
+        state["ids"] = set()
+        for line in lines[1:]:
+            try:
+                checkpoint = json.loads(line)
+            except ValueError:
+                break # the end, possibly cut short
+            state["offset"] = checkpoint["offset"]
+            state["ids"].update(checkpoint["ids"])
+        return state
+
+    def _append(self, record: dict):
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        self._file.write(_json_line(record))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def start(self, job_id: str, workflow: Optional[str] = None,
+            offset: int = 0, ids: Iterable[str] = ()):
+        """Start a new log for exporting job `job_id`, optionally with the
+        state of the partial file so far.  Replaces any previous log."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        directory, name = os.path.split(os.path.abspath(self.path))
+        fd, tmp_path = create_temp_file(directory, f".{name}.")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_json_line({"job_id": job_id, "workflow": workflow}))
+            if offset or ids:
+                f.write(_json_line({"offset": offset, "ids": list(ids)}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def checkpoint(self, offset: int, ids: List[str]):
+        """Suitable as an ExportWriter's `on_checkpoint`."""
+        self._append({"offset": offset, "ids": [i for i in ids if i is not None]})
+
+    def remove(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+WRITERS = {
+    JsonlWriter.extension: JsonlWriter,
+    CsvWriter.extension: CsvWriter,
+    ParquetWriter.extension: ParquetWriter,
+    ArrowWriter.extension: ArrowWriter,
+    FeatherWriter.extension: FeatherWriter,
+}
+
+
+def _split_compression(filename: str):
+    for suffix, codec in COMPRESSIONS.items():
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)], codec
+    return filename, None
+
+
+def export_format(filename: str) -> Optional[str]:
+    """The extension of a supported export file (without any compression
+    suffix), or None."""
+    base, codec = _split_compression(filename)
+    for extension, writer_class in WRITERS.items():
+        if base.endswith(extension):
+            if codec is not None and not writer_class.compressible:
+                return None
+            return extension
+    return None
+
+
+def supported_extensions():
+    extensions = list(WRITERS)
+    for extension, writer_class in WRITERS.items():
+        if writer_class.compressible:
+            extensions.extend(extension + suffix for suffix in COMPRESSIONS)
+    return extensions
+
+
+def writer_for(filename: str, fieldnames: Optional[Iterable[str]] = None,
+        **kwargs) -> ExportWriter:
+    """The ExportWriter for a filename, based on its extension."""
+    extension = export_format(filename)
+    if extension is None:
+        raise ValueError(
+            "Output filename must end with one of: "
+            + ", ".join(supported_extensions()))
+    writer_class = WRITERS[extension]
+    if writer_class.compressible:
+        kwargs.setdefault("codec", _split_compression(filename)[1])
+    if writer_class.needs_fieldnames:
+        return writer_class(filename, fieldnames or [], **kwargs)
+    return writer_class(filename, **kwargs)
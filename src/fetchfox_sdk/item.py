@@ -3,10 +3,15 @@ class Item:
     Wrapper for result items that provides attribute access with dot notation
     while maintaining dictionary-like compatibility.
     """
+    __slots__ = ("_data",)
+
     def __init__(self, data):
         self._data = data
 
     def __getattr__(self, name):
+        if name == "_data" or name.startswith("__"):
+            # Not set up yet, e.g. while being copied or unpickled
+            raise AttributeError(name)
         if name in self._data:
             return self._data[name]
         raise AttributeError(f"'Item' object has no attribute '{name}'")
@@ -55,4 +60,101 @@ class Item:
         return False
 
     def __bool__(self):
-        return bool(self._data)
\ No newline at end of file
+        return bool(self._data)
+
+class ItemSchema:
+    """The field names shared by many CompactItems, stored once."""
+    __slots__ = ("keys", "index")
+
+    def __init__(self, keys):
+        self.keys = tuple(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class CompactItem(Item):
+    """
+    An Item that keeps only a tuple of values, plus a reference to an
+    ItemSchema shared with other items that have the same fields.  For large
+    result sets of identically-shaped items this takes a fraction of the
+    memory of a dict per item.
+
+    Behaves like Item: attribute access, `item["key"]`, `keys()`, `items()`,
+    `get()`, `to_dict()` and comparisons with dicts all work the same.
+    """
+    __slots__ = ("_schema", "_values")
+
+    def __init__(self, schema: ItemSchema, values):
+        self._schema = schema
+        self._values = tuple(values)
+
+    @classmethod
+    def from_dict(cls, data: dict, schema: ItemSchema = None):
+        if schema is None:
+            schema = ItemSchema(data.keys())
+        return cls(schema, data.values())
+
+    @property
+    def _data(self):
+        return self.to_dict()
+
+    def __getattr__(self, name):
+        if name in ("_schema", "_values") or name.startswith("__"):
+            raise AttributeError(name)
+        i = self._schema.index.get(name)
+        if i is None:
+            raise AttributeError(f"'Item' object has no attribute '{name}'")
+        return self._values[i]
+
+    def __getitem__(self, key):
+        i = self._schema.index.get(key)
+        if i is None:
+            raise KeyError(key)
+        return self._values[i]
+
+    def __contains__(self, item):
+        return item in self._schema.index
+
+    def __iter__(self):
+        return iter(self._schema.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f"Item({self.to_dict()})"
+
+    def __str__(self):
+        return str(self.to_dict())
+
+    def keys(self):
+        return self._schema.keys
+
+    def items(self):
+        return tuple(zip(self._schema.keys, self._values))
+
+    def values(self):
+        return self._values
+
+    def to_dict(self):
+        return dict(zip(self._schema.keys, self._values))
+
+    def get(self, key, default=None):
+        i = self._schema.index.get(key)
+        return default if i is None else self._values[i]
+
+    def __eq__(self, other):
+        if isinstance(other, CompactItem):
+            if self._schema is other._schema:
+                return self._values == other._values
+            return self.to_dict() == other.to_dict()
+        elif isinstance(other, Item):
+            return self.to_dict() == other._data
+        elif isinstance(other, dict):
+            return self.to_dict() == other
+        return False
+
+    def __bool__(self):
+        return bool(self._values)
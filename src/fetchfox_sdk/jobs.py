@@ -0,0 +1,174 @@
+from typing import Iterable, Optional, Set
+
+from .item import Item
+
+
+class JobProgress:
+    """Tracks what a client has already seen of one job, across polls.
+
+    When the server supports incremental job status, each poll sends the
+    cursor returned by the previous response, and the server only sends the
+    result items, intermediate items and logs added since then.  If the
+    server does not return a cursor (older servers), we fall back to fetching
+    the full job status every poll and de-duplicating on our side.
+
+    Sections of the status the client doesn't need (e.g. intermediate items)
+    can be listed in `exclude`, which asks the server not to send them.
+    """
+
+    def __init__(self, job_id: str, incremental: bool = True,
+            cursor: Optional[str] = None,
+            seen_ids: Optional[Iterable[str]] = None,
+            exclude: Iterable[str] = ()):
+        """
+        Args:
+            job_id: the job being followed
+            incremental: ask the server for only what is new since the last poll
+            cursor: resume incremental polling from this server cursor
+            seen_ids: `_meta.id`s of result items which should not be yielded again
+            exclude: status sections the server may leave out, e.g. "full", "logs"
+        """
+        self.job_id = job_id
+        self.incremental = incremental
+        self.cursor = cursor
+        self.exclude = tuple(exclude)
+
+        self.seen_ids = set(seen_ids or ())
+        self.seen_log_summaries = set()
+        self.seen_logs = set()
+        self.seen_intermediate_item_ids = set()
+
+        self.polls = 0
+        self.done = False
+
+    def poll_params(self) -> Optional[dict]:
+        """Query string parameters for the next status poll."""
+        params = {}
+        if self.incremental:
+            params["incremental"] = "true"
+            if self.cursor is not None:
+                params["cursor"] = self.cursor
+        if self.exclude:
+            params["exclude"] = ",".join(self.exclude)
+        return params or None
+
+    def disable_incremental(self):
+        """Fall back to full status polls for the rest of this job."""
+        self.incremental = False
+        self.cursor = None
+
+    def fall_back(self):
+        """The server rejected our poll parameters: send none from now on."""
+        self.disable_incremental()
+        self.exclude = ()
+
+    def update(self, response: dict):
+        """Record a status response's cursor and completion."""
+        self.polls += 1
+        if response.get("done") == True:
+            self.done = True
+
+        if not self.incremental:
+            return
+        cursor = response.get("cursor")
+        if cursor is None:
+            # The server answered with a full status document
+            self.disable_incremental()
+        else:
+            self.cursor = cursor
+
+
+class JobStream:
+    """The result items of a job, yielded as they arrive, without keeping
+    them.  Returned by `FetchFox.stream_job()`.
+
+    The stream can be continued later, e.g. by another process: save its
+    `cursor` and `seen_ids`, and pass them to `stream_job()` again.  Both
+    only cover items which were actually yielded, so nothing is skipped,
+    even if the stream is interrupted halfway through a batch.
+    """
+
+    def __init__(self, progress: JobProgress, items):
+        """
+        Args:
+            progress: the JobProgress the items are polled with
+            items: generator of the job's new result items (dicts)
+        """
+        self._progress = progress
+        self._items = items
+        self._seen_ids = set(progress.seen_ids)
+        self._cursor = progress.cursor
+        self._batch_cursor = progress.cursor
+        self._exhausted = False
+
+    @property
+    def job_id(self) -> str:
+        return self._progress.job_id
+
+    @property
+    def done(self) -> bool:
+        """Whether the job is done, and every item was yielded."""
+        return self._exhausted and self._progress.done
+
+    @property
+    def cursor(self) -> Optional[str]:
+        """Server cursor up to which every item was yielded."""
+        return self._cursor
+
+    @property
+    def seen_ids(self) -> Set[str]:
+        """`_meta.id`s of the items yielded, plus those given initially."""
+        return set(self._seen_ids)
+
+    def state(self) -> dict:
+        """JSON-serializable state, for continuing the stream later with
+        `stream_job(**state)`."""
+        return {
+            "job_id": self.job_id,
+            "cursor": self._cursor,
+            "seen_ids": sorted(self._seen_ids),
+        }
+
+    def _yielded(self, item: dict) -> Item:
+        cursor = self._progress.cursor
+        if cursor != self._batch_cursor:
+            # A new poll was made, so the previous batch was all yielded
+            self._cursor = self._batch_cursor
+            self._batch_cursor = cursor
+        meta = item.get("_meta")
+        if isinstance(meta, dict) and "id" in meta:
+            self._seen_ids.add(meta["id"])
+        return Item(item)
+
+    def _finished(self):
+        self._cursor = self._batch_cursor = self._progress.cursor
+        self._exhausted = True
+
+    def __iter__(self):
+        for item in self._items:
+            yield self._yielded(item)
+        self._finished()
+
+    def close(self):
+        """Stop polling.  The job itself keeps running."""
+        self._items.close()
+
+
+class AsyncJobStream(JobStream):
+    """Async counterpart of JobStream, iterated with `async for`.  Returned
+    by `AsyncFetchFox.stream_job_async()`."""
+
+    def __iter__(self):
+        raise TypeError("Use `async for` with an AsyncJobStream")
+
+    async def __aiter__(self):
+        async for item in self._items:
+            yield self._yielded(item)
+        self._finished()
+
+    async def aclose(self):
+        """Stop polling.  The job itself keeps running."""
+        await self._items.aclose()
+
+    def close(self):
+        raise TypeError("Use `await stream.aclose()` with an AsyncJobStream")
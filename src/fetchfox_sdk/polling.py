@@ -0,0 +1,65 @@
+from typing import Optional
+
+
+class PollScheduler:
+    """Decides how long to wait between status polls of one job.
+
+    - While the job is not scheduled yet (404s), the wait backs off
+      exponentially from `min_interval` up to `max_interval`.
+    - While new items are arriving, we poll every `min_interval`.
+    - While nothing changes, the wait grows by `idle_factor` per poll,
+      up to `max_interval`.
+
+    If the server suggests a delay (a `Retry-After` header or a
+    `pollInterval` field in the job status, in seconds), we never poll
+    sooner than that.
+    """
+
+    def __init__(self, min_interval: float = 0.5, max_interval: float = 10.0,
+            backoff_factor: float = 2.0, idle_factor: float = 1.5):
+        """
+        Args:
+            min_interval: shortest wait between polls, in seconds
+            max_interval: longest wait between polls, in seconds
+            backoff_factor: growth of the wait while the job is unscheduled
+            idle_factor: growth of the wait while no new items arrive
+        """
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError(
+                "Poll intervals must satisfy 0 < min_interval <= max_interval")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.idle_factor = idle_factor
+
+        self._interval = min_interval
+        self._unscheduled_delay = None
+
+    def _with_hint(self, delay: float, hint: Optional[float]) -> float:
+        if hint is None:
+            return delay
+        try:
+            hint = float(hint)
+        except (TypeError, ValueError):
+            return delay
+        return max(delay, hint)
+
+    def unscheduled(self, hint: Optional[float] = None) -> float:
+        """Delay before polling again a job which is not scheduled yet."""
+        if self._unscheduled_delay is None:
+            self._unscheduled_delay = self.min_interval
+        else:
+            self._unscheduled_delay = min(
+                self.max_interval, self._unscheduled_delay * self.backoff_factor)
+        return self._with_hint(self._unscheduled_delay, hint)
+
+    def next_delay(self, new_items: int, hint: Optional[float] = None) -> float:
+        """Delay before the next poll, given how many new items the last
+        poll returned."""
+        self._unscheduled_delay = None
+        if new_items > 0:
+            self._interval = self.min_interval
+        else:
+            self._interval = min(
+                self.max_interval, self._interval * self.idle_factor)
+        return self._with_hint(self._interval, hint)
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+class RateLimiter:
+    """Limits how fast a client sends requests, and how many jobs it runs
+    at once.  Every request made by `FetchFox` goes through its limiter.
+
+    Requests are paced by a token bucket: up to `burst` requests may be sent
+    at once, after which they are spaced out to `rate` per second.  When the
+    server answers 429 (too many requests), the rate is halved (down to
+    `min_rate`), and no request is sent before its Retry-After time.  Each
+    successful request then adds `recovery` back to the rate, up to `rate`.
+
+    With `max_jobs`, starting a job waits while that many jobs started by
+    the client are still running.  Detached jobs don't count, as the client
+    never learns when they finish.
+
+    With `shared_dir`, the budget is shared by every limiter (in any
+    process on this machine) using the same directory.  The bucket is kept
+    in a file there, and jobs hold a lock on one of `max_jobs` slot files.
+    This needs `fcntl`, so isn't available on Windows.
+    """
+
+    def __init__(self, rate: float = 10.0, burst: Optional[float] = None,
+            max_jobs: Optional[int] = None, min_rate: float = 0.5,
+            recovery: float = 0.1, shared_dir: Optional[str] = None):
+        """
+        Args:
+            rate: requests per second
+            burst: requests which may be sent at once, after a quiet period.  Defaults to `rate`.
+            max_jobs: max jobs running at once.  None for no limit.
+            min_rate: 429 responses never reduce the rate below this
+            recovery: requests per second given back to the rate by each successful request
+            shared_dir: share the budget with other processes using this directory
+        """
+        if rate <= 0 or min_rate <= 0 or min_rate > rate:
+            raise ValueError("Rates must satisfy 0 < min_rate <= rate")
+        if shared_dir is not None and fcntl is None:
+            raise RuntimeError("shared_dir isn't supported on this platform")
+
+        self.rate = rate
+        self.burst = max(1.0, rate if burst is None else burst)
+        self.max_jobs = max_jobs
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.shared_dir = shared_dir
+
+        self._lock = threading.Lock()
+        self._bucket = self._new_bucket()
+        self._current_rate = rate
+        self._job_slots = None
+        if shared_dir is not None:
+            os.makedirs(shared_dir, exist_ok=True)
+        elif max_jobs:
+            self._job_slots = threading.BoundedSemaphore(max_jobs)
+
+    def _new_bucket(self) -> dict:
+        return {"rate": self.rate, "tokens": self.burst,
+            "updated": time.time(), "blocked_until": 0.0}
+
+    @contextmanager
+    def _locked_bucket(self):
+        """The bucket state, locked for update."""
+        if self.shared_dir is None:
+            with self._lock:
+                yield self._bucket
+            return
+
+        path = os.path.join(self.shared_dir, "bucket.json")
+        with self._lock, open(path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    bucket = json.load(f)
+                except ValueError:
+                    bucket = self._new_bucket()
+                yield bucket
+                f.seek(0)
+                f.truncate()
+                json.dump(bucket, f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def reserve(self) -> float:
+        """Take a token for one request.  Returns how many seconds to wait
+        before sending it."""
+        with self._locked_bucket() as bucket:
+            now = time.time()
+            rate = bucket["rate"]
+            bucket["tokens"] = min(self.burst,
+                bucket["tokens"] + (now - bucket["updated"]) * rate)
+            bucket["updated"] = now
+            bucket["tokens"] -= 1
+            self._current_rate = rate
+
+            wait = max(0.0, -bucket["tokens"] / rate)
+            return max(wait, bucket["blocked_until"] - now)
+
+    def throttled(self, retry_after: Optional[float] = None):
+        """The server rejected a request with 429: slow down."""
+        with self._locked_bucket() as bucket:
+            now = time.time()
+            bucket["rate"] = max(self.min_rate, bucket["rate"] / 2)
+            bucket["tokens"] = min(bucket["tokens"], 0.0)
+            if retry_after is not None:
+                bucket["blocked_until"] = max(
+                    bucket["blocked_until"], now + retry_after)
+            self._current_rate = bucket["rate"]
+
+    def succeeded(self):
+        """A request went through: recover some of the rate."""
+        if self._current_rate >= self.rate:
+            return
+        with self._locked_bucket() as bucket:
+            bucket["rate"] = min(self.rate, bucket["rate"] + self.recovery)
+            self._current_rate = bucket["rate"]
+
+    @property
+    def current_rate(self) -> float:
+        """Requests per second currently allowed."""
+        return self._current_rate
+
+    def acquire_job(self, block: bool = True):
+        """Take a slot for a job which is about to start, waiting for one if
+        `max_jobs` are running.  Returns the slot, to be given back to
+        `release_job()`, or None if `block` is False and there was no free
+        slot.
+        """
+        if not self.max_jobs:
+            return True
+        if self._job_slots is not None:
+            return True if self._job_slots.acquire(blocking=block) else None
+
+        while True:
+            for i in range(self.max_jobs):
+                f = open(os.path.join(self.shared_dir, f"job-{i}.lock"), "a")
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return f
+                except OSError:
+                    f.close()
+            if not block:
+                return None
+            time.sleep(0.5)
+
+    def release_job(self, slot):
+        """Give back a slot from `acquire_job()`."""
+        if slot is None or not self.max_jobs:
+            return
+        if self._job_slots is not None:
+            self._job_slots.release()
+            return
+        try:
+            fcntl.flock(slot, fcntl.LOCK_UN)
+        finally:
+            slot.close()
@@ -0,0 +1,206 @@
+import copy
+import hashlib
+import json
+import sys
+from collections.abc import Sequence
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import canonical_json
+from .item import CompactItem, Item, ItemSchema
+
+
+def _intern_key(key):
+    return sys.intern(key) if type(key) is str else key
+
+
+class ResultStore(Sequence):
+    """Compact storage for a workflow's result items.
+
+    Result items extracted by one workflow almost always share the same keys,
+    so rather than keeping a dict per item, each item is stored as a
+    `CompactItem`: a tuple of values plus a reference to its key layout
+    ("schema").  Each distinct schema's keys are stored (and interned) once.
+
+    The store reads like a list of plain dicts, which are rebuilt on access.
+    `view(i)` returns the stored item itself, without copying anything.
+    Length and indexing are O(1).
+    """
+
+    def __init__(self, items: Iterable = ()):
+        self._schemas: Dict[Tuple, ItemSchema] = {}
+        self._rows: List[CompactItem] = []
+        self._snapshot = None
+        self.extend(items)
+
+    def _schema(self, keys: Tuple) -> ItemSchema:
+        schema = self._schemas.get(keys)
+        if schema is None:
+            schema = ItemSchema(_intern_key(k) for k in keys)
+            self._schemas[schema.keys] = schema
+        return schema
+
+    def append(self, item):
+        """Add a result item (a dict or an Item)."""
+        if isinstance(item, CompactItem):
+            schema, values = self._schema(item._schema.keys), item._values
+        else:
+            if isinstance(item, Item):
+                item = item._data
+            schema, values = self._schema(tuple(item.keys())), item.values()
+        self._rows.append(CompactItem(schema, values))
+        self._snapshot = None
+
+    def extend(self, items: Iterable):
+        for item in items:
+            self.append(item)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def row(self, index: int) -> dict:
+        """Row `index`, as a new plain dict."""
+        return self._rows[index].to_dict()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [row.to_dict() for row in self._rows[index]]
+        return self.row(index)
+
+    def view(self, index: int) -> CompactItem:
+        """Row `index`, as an Item."""
+        return self._rows[index]
+
+    def views(self) -> List[CompactItem]:
+        """All rows, as Items."""
+        return list(self._rows)
+
+    def __iter__(self):
+        for row in self._rows:
+            yield row.to_dict()
+
+    def __contains__(self, value):
+        return any(row == value for row in self._rows)
+
+    def fieldnames(self) -> set:
+        """Every key used by any of the items."""
+        keys = set()
+        for schema in self._schemas.values():
+            keys.update(schema.keys)
+        return keys
+
+    def to_list(self) -> List[dict]:
+        return list(self)
+
+    def snapshot(self, job_id: Optional[str] = None) -> "ResultSnapshot":
+        """A snapshot of the current rows, unaffected by later changes.  Repeated calls share
+        one snapshot, until more rows are added."""
+        if self._snapshot is None or self._snapshot.job_id != job_id:
+            self._snapshot = ResultSnapshot(self._rows, job_id=job_id)
+        return self._snapshot
+
+    def __eq__(self, other):
+        if isinstance(other, ResultStore):
+            return self._rows == other._rows
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self._rows, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"ResultStore({len(self)} items)"
+
+
+def _has_nested_values(row: CompactItem) -> bool:
+    return any(isinstance(value, (dict, list)) for value in row._values)
+
+
+def _own_nested_values(row: CompactItem) -> CompactItem:
+    """The row, or a copy of it with its own nested values."""
+    if not _has_nested_values(row):
+        return row
+    return CompactItem(row._schema, copy.deepcopy(row._values))
+
+
+def _row_dict(row: CompactItem) -> dict:
+    """The row as a new plain dict, sharing no nested values with it."""
+    if not _has_nested_values(row):
+        return row.to_dict()
+    return copy.deepcopy(row.to_dict())
+
+
+class ResultSnapshot(Sequence):
+    """The results of a workflow, frozen for use as the input of workflows
+    derived from it.
+
+    All the derived workflows share one snapshot, rather than each getting a
+    deep copy of the results, and the snapshot's JSON encoding and content
+    hash are computed once, on first use.  It reads like a list of plain
+    dicts.
+
+    Rows are CompactItems, whose tuples of values can't change, but nested
+    values (like `_meta`) are dicts and lists which could.  So the snapshot
+    takes its own copy of those when it is created, and hands out copies
+    of them, so that it is never affected by changes to the workflow it was
+    taken from, or to the dicts it returned.
+    """
+
+    def __init__(self, rows: Iterable[CompactItem], job_id: Optional[str] = None):
+        """
+        Args:
+            rows: the result items
+            job_id: the job which produced them, if any
+        """
+        self._rows = tuple(_own_nested_values(row) for row in rows)
+        self.job_id = job_id
+        self._json = None
+        self._digest = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [_row_dict(row) for row in self._rows[index]]
+        return _row_dict(self._rows[index])
+
+    def __iter__(self):
+        for row in self._rows:
+            yield _row_dict(row)
+
+    def to_list(self) -> List[dict]:
+        return list(self)
+
+    def to_json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(self.to_list())
+        return self._json
+
+    @property
+    def digest(self) -> str:
+        """A content hash of the items."""
+        if self._digest is None:
+            self._digest = hashlib.sha256(
+                canonical_json(self.to_list()).encode("utf-8")).hexdigest()
+        return self._digest
+
+    def __eq__(self, other):
+        if isinstance(other, ResultSnapshot):
+            return self._rows == other._rows
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self._rows, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    # Immutable: copies may share it
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return f"ResultSnapshot({len(self)} items)"
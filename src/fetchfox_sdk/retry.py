@@ -0,0 +1,140 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, Optional
+
+import requests
+
+
+def retry_after_seconds(response) -> Optional[float]:
+    """Parse a response's Retry-After header (seconds or HTTP date) into
+    seconds from now.  Returns None if there is no usable header."""
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """Decides whether (and how long to wait before) a failed API call is
+    retried.  Every request made by `FetchFox` goes through its policy.
+
+    The defaults retry transient gateway errors and rate limiting with
+    exponential backoff and "full" jitter, honor `Retry-After` headers, and
+    give up once the total time spent on one call would exceed `deadline`.
+
+    Non-idempotent requests (e.g. POST, which starts jobs) are only retried
+    when we know the server didn't act on them: connection failures before
+    the request was sent, or the statuses listed for that method in
+    `method_statuses`.
+
+    To customize beyond the arguments below, subclass and override
+    `get_delay()`.
+    """
+
+    DEFAULT_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+    DEFAULT_METHOD_STATUSES = {"POST": frozenset({429, 503})}
+    IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+    def __init__(self, max_retries: int = 5, backoff_base: float = 0.5,
+            backoff_max: float = 30.0, jitter: bool = True,
+            retry_statuses: Optional[Iterable[int]] = None,
+            method_statuses: Optional[Dict[str, Iterable[int]]] = None,
+            respect_retry_after: bool = True,
+            deadline: Optional[float] = 120.0):
+        """
+        Args:
+            max_retries: retries after the first attempt.  0 disables retrying.
+            backoff_base: delay before the first retry, doubled for each further retry
+            backoff_max: upper bound for a computed backoff delay
+            jitter: randomize delays between 0 and the computed backoff
+            retry_statuses: HTTP statuses that are retried for idempotent methods
+            method_statuses: per-method override of retry_statuses, e.g. {"POST": [429]}
+            respect_retry_after: wait as long as the server's Retry-After header asks
+            deadline: total seconds one call may take, including all retries and waits.  None for no limit.
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retry_statuses = frozenset(
+            self.DEFAULT_RETRY_STATUSES if retry_statuses is None
+            else retry_statuses)
+        self.method_statuses = {
+            method.upper(): frozenset(statuses)
+            for method, statuses in (
+                self.DEFAULT_METHOD_STATUSES if method_statuses is None
+                else method_statuses
+            ).items()
+        }
+        self.respect_retry_after = respect_retry_after
+        self.deadline = deadline
+
+    def statuses_for(self, method: str) -> frozenset:
+        return self.method_statuses.get(method.upper(), self.retry_statuses)
+
+    def is_retryable(self, method: str, error: Exception) -> bool:
+        """Whether this error, on this method, is worth another attempt."""
+        response = getattr(error, "response", None)
+        if response is not None:
+            return response.status_code in self.statuses_for(method)
+
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            # Never connected, so the request was never sent
+            return True
+        if method.upper() not in self.IDEMPOTENT_METHODS:
+            return False
+        return isinstance(error, (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ))
+
+    def backoff(self, attempt: int) -> float:
+        """Computed delay before retry number `attempt` (0-based)."""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        """Seconds requested by a Retry-After header, if any."""
+        return retry_after_seconds(getattr(error, "response", None))
+
+    def get_delay(self, method: str, attempt: int, error: Exception,
+            elapsed: float) -> Optional[float]:
+        """Return how long to sleep before retrying, or None to give up and
+        raise `error`.
+
+        Args:
+            method: HTTP method of the failed request
+            attempt: number of retries already made for this call
+            error: the exception raised by the failed attempt
+            elapsed: seconds spent on this call so far
+        """
+        if attempt >= self.max_retries:
+            return None
+        if not self.is_retryable(method, error):
+            return None
+
+        delay = None
+        if self.respect_retry_after:
+            delay = self.retry_after(error)
+        if delay is None:
+            delay = self.backoff(attempt)
+
+        if self.deadline is not None and elapsed + delay > self.deadline:
+            return None
+        return delay
@@ -0,0 +1,267 @@
+import asyncio
+from queue import Queue
+from typing import Callable, Dict, List, Optional
+
+
+_DONE = object()
+
+
+class _ShardMerge:
+    """Decides when the items of several shards are yielded: at once, or
+    when `ordered`, shard by shard, holding those of later shards."""
+
+    def __init__(self, count: int, ordered: bool):
+        self.count = count
+        self.ordered = ordered
+        self.buffered: Dict[int, list] = {}
+        self.finished = set()
+        self.current = 0 # the shard being yielded, when ordered
+
+    @property
+    def done(self) -> bool:
+        return len(self.finished) >= self.count
+
+    def item(self, index: int, item) -> list:
+        """The (shard index, item) pairs to yield, now that `item` arrived."""
+        if not self.ordered or index == self.current:
+            return [(index, item)]
+        self.buffered.setdefault(index, []).append(item)
+        return []
+
+    def finish(self, index: int) -> list:
+        """The (shard index, item) pairs to yield, now that shard `index`
+        is done."""
+        self.finished.add(index)
+        ready = []
+        if self.ordered:
+            while self.current in self.finished:
+                # The shards after it may have everything already
+                self.current += 1
+                for item in self.buffered.pop(self.current, ()):
+                    ready.append((self.current, item))
+        return ready
+
+
+class ShardedRun:
+    """Runs several workflows (the shards of one big workflow) as separate
+    jobs, at most `max_concurrency` at a time, and merges their results
+    into one stream.
+
+    With `start_job`, the shards can be anything which that function knows
+    how to start a job for, e.g. the parameters of one registered workflow.
+
+    With `ordered`, items are yielded shard by shard, in shard order; items
+    of later shards which arrive early are held until their turn.
+    Otherwise, items are yielded as soon as they arrive from any shard.
+
+    Jobs are followed by the client's JobWatcher when it has one, or else
+    each by a task in the client's executor.
+    """
+
+    def __init__(self, sdk, shards: List, max_concurrency: int = 4,
+            ordered: bool = True, stream_kwargs: Optional[dict] = None,
+            start_job: Optional[Callable[..., str]] = None):
+        """
+        Args:
+            sdk: the FetchFox client
+            shards: the Workflows to run
+            max_concurrency: max jobs running at once
+            ordered: yield results in shard order, rather than as they come
+            stream_kwargs: options for following each job, as from `Workflow._job_stream_kwargs()`
+            start_job: called as start_job(shard, job_slot) to start the job of a shard, and return its ID.  `job_slot` is passed on to `FetchFox._run_workflow()`.  By default, the shard is run as a workflow.
+        """
+        self._sdk = sdk
+        self.shards = shards
+        self.max_concurrency = max(1, max_concurrency)
+        self.ordered = ordered
+        self.stream_kwargs = stream_kwargs or {}
+        self.job_ids: List[Optional[str]] = [None] * len(shards)
+        self._start_job = start_job or (
+            lambda shard, job_slot: sdk._run_workflow(
+                workflow=shard, job_slot=job_slot))
+
+        self._queue = Queue()
+        self._futures = {}
+        self._next_shard = 0
+        self._running = 0
+        self._closed = False
+        self._stop_jobs = True
+
+    def _started(self, index, job_id):
+        self.job_ids[index] = job_id
+        if self._closed and self._stop_jobs:
+            # Closed while this job was starting
+            self._sdk._stop_job(job_id)
+
+    def _launch(self, index: int):
+        shard = self.shards[index]
+        queue = self._queue
+
+        def start(job_slot=None):
+            job_id = self._start_job(shard, job_slot)
+            self._started(index, job_id)
+            return job_id
+
+        watcher = getattr(self._sdk, '_watcher', None)
+        if watcher is not None:
+            watched = watcher.watch(
+                start=start,
+                on_item=lambda item: queue.put((index, item)),
+                **self.stream_kwargs)
+            future = watched.future
+        else:
+            def follow():
+                for item in self._sdk._job_result_items_gen(
+                        start(), **self.stream_kwargs):
+                    if self._closed:
+                        return
+                    queue.put((index, item))
+
+            future = self._sdk._submit(follow)
+
+        self._futures[index] = future
+        future.add_done_callback(lambda future: queue.put((index, _DONE)))
+
+    def _launch_more(self):
+        while (not self._closed and self._running < self.max_concurrency
+                and self._next_shard < len(self.shards)):
+            self._launch(self._next_shard)
+            self._next_shard += 1
+            self._running += 1
+
+    def __iter__(self):
+        """Yield the merged result items (dicts).  Raises the first error of
+        any shard's job."""
+        for _, item in self.tagged():
+            yield item
+
+    def close(self, stop_jobs: bool = True):
+        """Launch no more shards, and stop following the running ones.
+
+        Args:
+            stop_jobs: also stop the running jobs on the server
+        """
+        self._closed = True
+        self._stop_jobs = stop_jobs
+        for index, future in list(self._futures.items()):
+            job_id = self.job_ids[index]
+            if future.done():
+                continue
+            if job_id is None:
+                # Not started yet, e.g. waiting for a job slot: never start
+                # it.  One which is starting is stopped once it has started.
+                future.cancel()
+                continue
+            if stop_jobs:
+                self._sdk._stop_job(job_id)
+            elif getattr(self._sdk, '_watcher', None) is not None:
+                self._sdk._watcher.unwatch(job_id)
+
+    def tagged(self):
+        """Like iterating, but yields (shard index, item) pairs."""
+        merge = _ShardMerge(len(self.shards), self.ordered)
+
+        self._launch_more()
+        while not merge.done:
+            index, item = self._queue.get()
+            if item is _DONE:
+                self._running -= 1
+                error = self._futures[index].exception()
+                if error is not None:
+                    raise error
+                self._launch_more()
+                yield from merge.finish(index)
+            else:
+                yield from merge.item(index, item)
+
+
+class AsyncShardedRun:
+    """Async counterpart of ShardedRun, for an AsyncFetchFox client: each
+    job is followed by a task on the event loop."""
+
+    def __init__(self, sdk, shards: List, max_concurrency: int = 4,
+            ordered: bool = True, stream_kwargs: Optional[dict] = None):
+        """
+        Args:
+            sdk: the AsyncFetchFox client
+            shards: the Workflows to run
+            max_concurrency: max jobs running at once
+            ordered: yield results in shard order, rather than as they come
+            stream_kwargs: options for following each job, as from `Workflow._job_stream_kwargs()`
+        """
+        self._sdk = sdk
+        self.shards = shards
+        self.max_concurrency = max(1, max_concurrency)
+        self.ordered = ordered
+        self.stream_kwargs = stream_kwargs or {}
+        self.job_ids: List[Optional[str]] = [None] * len(shards)
+
+        self._queue = None # created on the event loop
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._next_shard = 0
+        self._running = 0
+        self._closed = False
+
+    async def _follow(self, index: int):
+        job_id = await self._sdk._arun_workflow(workflow=self.shards[index])
+        self.job_ids[index] = job_id
+        items = self._sdk._ajob_result_items_gen(job_id, **self.stream_kwargs)
+        try:
+            async for item in items:
+                self._queue.put_nowait((index, item))
+        finally:
+            await items.aclose()
+
+    def _launch_more(self):
+        while (not self._closed and self._running < self.max_concurrency
+                and self._next_shard < len(self.shards)):
+            index = self._next_shard
+            task = asyncio.ensure_future(self._follow(index))
+            task.add_done_callback(
+                lambda task, index=index: self._queue.put_nowait((index, _DONE)))
+            self._tasks[index] = task
+            self._next_shard += 1
+            self._running += 1
+
+    async def __aiter__(self):
+        """Yield the merged result items (dicts).  Raises the first error of
+        any shard's job."""
+        async for _, item in self.tagged():
+            yield item
+
+    async def tagged(self):
+        """Like iterating, but yields (shard index, item) pairs."""
+        self._queue = asyncio.Queue()
+        merge = _ShardMerge(len(self.shards), self.ordered)
+
+        self._launch_more()
+        while not merge.done:
+            index, item = await self._queue.get()
+            if item is _DONE:
+                self._running -= 1
+                error = self._tasks[index].exception()
+                if error is not None:
+                    raise error
+                self._launch_more()
+                ready = merge.finish(index)
+            else:
+                ready = merge.item(index, item)
+            for pair in ready:
+                yield pair
+
+    async def aclose(self, stop_jobs: bool = True):
+        """Launch no more shards, and stop following the running ones.
+
+        Args:
+            stop_jobs: also stop the running jobs on the server
+        """
+        self._closed = True
+        running = [task for task in self._tasks.values() if not task.done()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        if stop_jobs:
+            for job_id in self.job_ids:
+                if job_id:
+                    # Only stops the jobs which are still running
+                    await self._sdk._astop_job(job_id)
@@ -0,0 +1,92 @@
+from typing import Iterable, Iterator, Tuple
+
+try:
+    import ijson
+except ImportError: # pragma: no cover - optional dependency
+    ijson = None
+
+
+ITEMS_PREFIX = "results.items"
+INTERMEDIATE_PREFIX = "results.full"
+LOG_SUMMARIES_PREFIX = "results.logs.tail"
+RAW_LOGS_PREFIX = "results.logs.raw"
+
+# Raised by iter_job_status() for a document which isn't valid JSON, e.g.
+# because it was cut short
+DECODE_ERRORS = (ijson.JSONError,) if ijson is not None else ()
+
+
+def streaming_available() -> bool:
+    return ijson is not None
+
+
+def _under(prefix: str, paths: Iterable[str]) -> bool:
+    for path in paths:
+        if prefix == path or prefix.startswith(path + "."):
+            return True
+    return False
+
+
+def iter_job_status(fp, skip: Iterable[str] = ()) -> Iterator[Tuple[str, object]]:
+    """Incrementally decode a job status document from a file-like object.
+
+    Yields `("item", item)` for each entry of `results.items` as soon as it
+    has been decoded, then a final `("status", status)` with the rest of the
+    document.  In that final status, `results.items` is an empty list if the
+    document had result items (they were already yielded), and the sections
+    listed in `skip` (dotted paths such as `results.full`) are left out
+    entirely, without ever being turned into Python objects.
+
+    Requires the optional `ijson` dependency.
+    """
+    if ijson is None:
+        raise ImportError(
+            "Streaming job status requires ijson.  "
+            "Install it with: pip install fetchfox-sdk[streaming]")
+
+    skip = tuple(skip)
+    item_prefix = ITEMS_PREFIX + ".item"
+
+    root = ijson.ObjectBuilder()
+    had_items = False
+    item_builder = None
+    item_depth = 0
+
+    for prefix, event, value in ijson.parse(fp, use_float=True):
+        if prefix == item_prefix or prefix.startswith(item_prefix + "."):
+            if item_builder is None:
+                if event in ("start_map", "start_array"):
+                    item_builder = ijson.ObjectBuilder()
+                    item_depth = 0
+                else:
+                    # A scalar item
+                    yield "item", value
+                    continue
+            item_builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                item_depth += 1
+            elif event in ("end_map", "end_array"):
+                item_depth -= 1
+            if item_depth == 0:
+                yield "item", item_builder.value
+                item_builder = None
+            continue
+
+        if prefix == ITEMS_PREFIX:
+            # start/end of the items array itself
+            had_items = True
+            continue
+
+        if event == "map_key":
+            path = f"{prefix}.{value}" if prefix else value
+            if path == ITEMS_PREFIX or _under(path, skip):
+                continue
+        elif _under(prefix, skip):
+            continue
+
+        root.event(event, value)
+
+    status = root.value if isinstance(getattr(root, "value", None), dict) else {}
+    if had_items:
+        status.setdefault("results", {})["items"] = []
+    yield "status", status
@@ -0,0 +1,144 @@
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PooledTransport:
+    """Persistent, keep-alive HTTP transport used by a FetchFox instance.
+
+    All API calls made through one FetchFox share a single
+    `requests.Session`, so TCP+TLS connections are reused between polls
+    instead of being re-established for every request.  The session is safe
+    to share between the threads started by `Workflow.results_future()`.
+
+    If the transport sits idle for longer than `idle_timeout` seconds, the
+    pooled connections are closed and a fresh pool is created on next use,
+    so we don't hold sockets that the server (or a proxy) has likely dropped.
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10,
+            pool_block: bool = False, idle_timeout: Optional[float] = 60.0):
+        """
+        Args:
+            pool_connections: number of per-host pools to keep around
+            pool_maxsize: max connections kept alive per host
+            pool_block: if True, block when all connections to a host are busy, instead of opening an extra (non-pooled) connection
+            idle_timeout: seconds of inactivity after which pooled connections are dropped.  None disables idle eviction.
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.idle_timeout = idle_timeout
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._adapter = None
+        self._last_used = None
+        self._in_flight = 0
+
+        self._requests = 0
+        self._sessions_created = 0
+        self._idle_evictions = 0
+        # Connection/request counts of pools that have already been closed
+        self._retired_connections = 0
+        self._retired_pool_requests = 0
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self._session = session
+        self._adapter = adapter
+        self._sessions_created += 1
+
+    def _retire_session(self):
+        if self._session is None:
+            return
+        connections, pool_requests = self._pool_counts()
+        self._retired_connections += connections
+        self._retired_pool_requests += pool_requests
+        self._session.close()
+        self._session = None
+        self._adapter = None
+
+    def _pool_counts(self):
+        """Sum the counters urllib3 keeps on each live connection pool."""
+        connections = 0
+        pool_requests = 0
+        if self._adapter is None:
+            return connections, pool_requests
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            connections += getattr(pool, "num_connections", 0)
+            pool_requests += getattr(pool, "num_requests", 0)
+        return connections, pool_requests
+
+    def _acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            if (self._session is not None
+                    and self.idle_timeout is not None
+                    and self._in_flight == 0
+                    and self._last_used is not None
+                    and now - self._last_used > self.idle_timeout):
+                self._retire_session()
+                self._idle_evictions += 1
+
+            if self._session is None:
+                self._new_session()
+
+            self._in_flight += 1
+            self._requests += 1
+            return self._session
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._last_used = time.monotonic()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Same signature as `requests.request`, but over pooled connections."""
+        session = self._acquire()
+        try:
+            return session.request(method, url, **kwargs)
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        """Return a snapshot of connection pool statistics.
+
+        `connections_opened` counts new TCP connections, so
+        `requests - connections_opened` is the number of requests that were
+        served over an already-open (kept-alive) connection.
+        """
+        with self._lock:
+            connections, pool_requests = self._pool_counts()
+            connections_opened = self._retired_connections + connections
+            return {
+                "requests": self._requests,
+                "in_flight": self._in_flight,
+                "connections_opened": connections_opened,
+                "connections_reused": max(0, self._requests - connections_opened),
+                "pool_requests": self._retired_pool_requests + pool_requests,
+                "sessions_created": self._sessions_created,
+                "idle_evictions": self._idle_evictions,
+                "pool_connections": self.pool_connections,
+                "pool_maxsize": self.pool_maxsize,
+            }
+
+    def close(self):
+        """Close all pooled connections.  The transport may still be used
+        afterwards; a new pool will be created on demand."""
+        with self._lock:
+            self._retire_session()
@@ -0,0 +1,449 @@
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from .item import Item
+from .jobs import JobProgress
+
+
+class WatchedJob:
+    """One job followed by a JobWatcher.
+
+    `future` resolves to the list of all result Items once the job is done.
+    `queue` receives each new result item (a dict) as it arrives, followed by
+    `JobWatcher.DONE` when the job is finished (or failed).
+    """
+
+    def __init__(self, progress: Optional[JobProgress], scheduler,
+            raw_log_level=logging.ERROR,
+            log_summaries_dest=None,
+            intermediate_items_dest=None,
+            on_item: Optional[Callable[[dict], None]] = None,
+            on_done: Optional[Callable[[list], None]] = None,
+            on_started: Optional[Callable[[str], None]] = None):
+        self.progress = progress
+        self.scheduler = scheduler
+        self.raw_log_level = raw_log_level
+        self.log_summaries_dest = log_summaries_dest
+        self.intermediate_items_dest = intermediate_items_dest
+        self.on_item = on_item
+        self.on_done = on_done
+        self.on_started = on_started
+
+        self.future = Future()
+        self.queue = Queue()
+        self.items = []
+
+        self.next_poll_at = time.monotonic()
+        self.first_response_at = None
+        self.unscheduled_since = None
+
+    @property
+    def job_id(self) -> Optional[str]:
+        if self.progress is None:
+            return None
+        return self.progress.job_id
+
+    def iter_items(self):
+        """Yield result items (dicts) as they arrive, until the job is done.
+        Re-raises the job's error, if it failed."""
+        while True:
+            item = self.queue.get()
+            if item is JobWatcher.DONE:
+                break
+            yield item
+        self.future.result()
+
+
+class JobWatcher:
+    """A single background poller for all the jobs a FetchFox client is
+    waiting on.
+
+    Instead of one thread per job each polling its own status, the watcher
+    thread wakes up when any job is due, fetches the status of all due jobs
+    at once (through the bulk status endpoint when the server offers it,
+    otherwise with at most `max_concurrency` requests in flight), and fans
+    new items out to each job's queue and future.
+
+    Requests are run in the client's executor (see `FetchFox._submit`).
+    When the client's rate limiter caps the number of running jobs, jobs
+    wait for a slot here, rather than in an executor thread, so that the
+    executor stays free to poll the running jobs until they finish.
+    """
+
+    DONE = object()
+
+    MAX_WAIT_FOR_JOB_ALIVE_MINUTES = 5
+    MAX_WAIT_FOR_CHANGE_MINUTES = 5
+    # How often jobs waiting for a job slot check for one.  Slots may be
+    # freed by jobs the watcher doesn't follow, or by other processes.
+    SLOT_CHECK_INTERVAL = 0.2
+
+    def __init__(self, sdk, max_concurrency: int = 8, bulk_status: bool = True):
+        """
+        Args:
+            sdk: the FetchFox client whose jobs are watched
+            max_concurrency: max status requests in flight when polling jobs one by one
+            bulk_status: try the bulk status endpoint first
+        """
+        self._sdk = sdk
+        self.max_concurrency = max_concurrency
+        self.bulk_status = bulk_status
+
+        self._jobs: Dict[str, WatchedJob] = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._window = threading.BoundedSemaphore(max_concurrency)
+        # (watched, start) of jobs waiting for a job slot, in order
+        self._waiting = collections.deque()
+
+    def watch(self, job_id: Optional[str] = None,
+            start: Optional[Callable[[], str]] = None,
+            on_started: Optional[Callable[[str], None]] = None,
+            progress: Optional[JobProgress] = None,
+            poll_min_interval: Optional[float] = None,
+            poll_max_interval: Optional[float] = None,
+            **kwargs) -> WatchedJob:
+        """Start watching a job.
+
+        Provide either the `job_id` of a running job, or a `start` callable
+        which launches the job and returns its ID.  `start` is run in the
+        client's executor, so that launching many jobs doesn't block the
+        caller.  It's called with the rate limiter's job slot reserved for
+        the job (None without a rate limiter), which it should pass on to
+        `FetchFox._run_workflow()`.
+
+        Args:
+            job_id: ID of an already running job
+            start: callable that starts a job and returns its ID
+            on_started: called with the job ID, once known
+            progress: resume from this JobProgress
+            poll_min_interval: override the client's poll intervals for this job
+            poll_max_interval: override the client's poll intervals for this job
+            kwargs: raw_log_level, log_summaries_dest, intermediate_items_dest, on_item, and on_done (called with all result dicts before the future resolves)
+
+        Returns:
+            The WatchedJob, which exposes a future and a queue of items.
+        """
+        if (job_id is None) == (start is None):
+            raise ValueError("Provide exactly one of job_id or start")
+        if self._closed:
+            raise RuntimeError("This JobWatcher has been closed.")
+
+        scheduler = self._sdk._poll_scheduler(poll_min_interval, poll_max_interval)
+        watched = WatchedJob(progress, scheduler, on_started=on_started, **kwargs)
+        watched.future.add_done_callback(
+            lambda future: self._cancelled(watched) if future.cancelled() else None)
+
+        if job_id is not None:
+            self._attach(watched, job_id)
+            return watched
+
+        job_slot = self._sdk._try_acquire_job_slot()
+        if job_slot is False:
+            # Wait for a running job to finish, without taking up a thread
+            with self._cond:
+                self._waiting.append((watched, start))
+                self._ensure_thread()
+                self._cond.notify()
+        else:
+            self._submit_start(watched, start, job_slot)
+        return watched
+
+    def _attach(self, watched: WatchedJob, job_id: str):
+        if watched.progress is None:
+            watched.progress = self._sdk._new_job_progress(
+                job_id,
+                raw_log_level=watched.raw_log_level,
+                log_summaries_dest=watched.log_summaries_dest,
+                intermediate_items_dest=watched.intermediate_items_dest)
+        if watched.on_started is not None:
+            watched.on_started(job_id)
+        with self._cond:
+            closed = self._closed or watched.future.cancelled()
+            if not closed:
+                self._jobs[job_id] = watched
+                self._ensure_thread()
+                self._cond.notify()
+        if closed:
+            watched.future.cancel()
+            self._sdk._job_finished(job_id)
+            watched.queue.put(self.DONE)
+
+    def _submit_start(self, watched: WatchedJob, start, job_slot):
+        def _start():
+            try:
+                self._attach(watched, start(job_slot))
+            except BaseException as e:
+                self._finish(watched, error=e)
+        try:
+            self._sdk._submit(_start)
+        except BaseException:
+            self._sdk._release_job_slot(job_slot)
+            raise
+
+    def _start_waiting(self):
+        """Start the jobs waiting for a job slot, while slots are free."""
+        while True:
+            with self._cond:
+                if self._closed or not self._waiting:
+                    return
+                try:
+                    job_slot = self._sdk._try_acquire_job_slot()
+                except Exception as e:
+                    job_slot, error = None, e
+                else:
+                    error = None
+                if job_slot is False:
+                    return
+                watched, start = self._waiting.popleft()
+            if error is not None:
+                self._finish(watched, error=error)
+                continue
+            try:
+                self._submit_start(watched, start, job_slot)
+            except BaseException as e:
+                self._finish(watched, error=e)
+
+    def _cancelled(self, watched: WatchedJob):
+        """Its future was cancelled: stop following the job, or don't start
+        it, if it's still waiting for a job slot."""
+        with self._cond:
+            self._waiting = collections.deque(
+                entry for entry in self._waiting if entry[0] is not watched)
+            job_id = watched.job_id
+            if job_id is not None and self._jobs.get(job_id) is watched:
+                del self._jobs[job_id]
+        if job_id is not None:
+            self._sdk._job_finished(job_id)
+        watched.queue.put(self.DONE)
+
+    def unwatch(self, job_id: str):
+        """Stop polling a job.  Its future is cancelled."""
+        with self._cond:
+            watched = self._jobs.pop(job_id, None)
+        if watched is not None:
+            watched.future.cancel()
+            watched.queue.put(self.DONE)
+
+    @property
+    def watched_job_ids(self) -> List[str]:
+        with self._cond:
+            return list(self._jobs)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="fetchfox-job-watcher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._closed:
+                try:
+                    self._run_once()
+                except Exception as e:
+                    # Keep following the other jobs
+                    self._sdk.logger.warning("Job watcher error: %s", e)
+        finally:
+            self._fail_pending()
+
+    def _run_once(self):
+        """Wait until jobs are due, or poll those which are."""
+        self._start_waiting()
+        with self._cond:
+            if self._closed:
+                return
+            now = time.monotonic()
+            due = [w for w in self._jobs.values() if w.next_poll_at <= now]
+            if not due:
+                timeout = None
+                if self._jobs:
+                    next_at = min(w.next_poll_at for w in self._jobs.values())
+                    timeout = max(0, next_at - now)
+                if self._waiting and (
+                        timeout is None or timeout > self.SLOT_CHECK_INTERVAL):
+                    timeout = self.SLOT_CHECK_INTERVAL
+                self._cond.wait(timeout=timeout)
+                return
+
+        try:
+            statuses = self._fetch_statuses(due)
+        except Exception as e:
+            # E.g. the client was closed: these jobs can't be polled
+            statuses = {watched.job_id: e for watched in due}
+        for watched in due:
+            try:
+                self._handle(watched, statuses.get(watched.job_id))
+            except Exception as e:
+                self._finish(watched, error=e)
+
+    def _fail_pending(self):
+        """The poller stopped: fail the futures of the jobs it was
+        following, rather than leaving them waiting forever."""
+        with self._cond:
+            pending = list(self._jobs.values())
+            pending.extend(watched for watched, _ in self._waiting)
+            self._jobs.clear()
+            self._waiting.clear()
+        for watched in pending:
+            self._finish(watched,
+                error=RuntimeError("The job watcher stopped unexpectedly."))
+
+    def _fetch_statuses(self, due: List[WatchedJob]) -> dict:
+        """Return {job_id: status dict or exception} for the due jobs."""
+        if self.bulk_status and len(due) > 1:
+            try:
+                return self._fetch_bulk(due)
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code in (400, 404, 405):
+                    self._sdk.logger.debug(
+                        "Bulk job status not available, polling jobs individually")
+                    self.bulk_status = False
+                else:
+                    self._sdk.logger.info("Bulk job status failed: %s", e)
+            except requests.exceptions.RequestException as e:
+                self._sdk.logger.info("Bulk job status failed: %s", e)
+
+        def _fetch_one(watched):
+            try:
+                return self._sdk._get_job_status(
+                    watched.job_id, params=watched.progress.poll_params())
+            except Exception as e:
+                return e
+
+        # Sliding window: at most max_concurrency status requests in flight
+        futures = []
+        for watched in due:
+            self._window.acquire()
+            try:
+                future = self._sdk._submit(_fetch_one, watched)
+            except BaseException:
+                self._window.release()
+                raise
+            future.add_done_callback(lambda _: self._window.release())
+            futures.append((watched, future))
+
+        statuses = {}
+        for watched, future in futures:
+            try:
+                statuses[watched.job_id] = future.result()
+            except Exception as e:
+                statuses[watched.job_id] = e
+        return statuses
+
+    def _fetch_bulk(self, due: List[WatchedJob]) -> dict:
+        body = {
+            "jobs": [
+                dict(w.progress.poll_params() or {}, id=w.job_id) for w in due
+            ]
+        }
+        response = self._sdk._request("POST", "jobs/status", body)
+        statuses = response.get("jobs") or {}
+        return {
+            w.job_id: statuses.get(w.job_id, _NotScheduled(w.job_id))
+            for w in due
+        }
+
+    def _handle(self, watched: WatchedJob, status):
+        now = time.monotonic()
+
+        if isinstance(status, requests.exceptions.HTTPError):
+            code = status.response.status_code if status.response is not None else None
+            if code == 400 and watched.progress.poll_params() is not None:
+                watched.progress.fall_back()
+                return
+            if code not in (404, 500):
+                self._finish(watched, error=status)
+                return
+            status = _NotScheduled(watched.job_id)
+
+        if isinstance(status, _NotScheduled):
+            if watched.unscheduled_since is None:
+                watched.unscheduled_since = now
+            elif now - watched.unscheduled_since > self.MAX_WAIT_FOR_JOB_ALIVE_MINUTES * 60:
+                self._finish(watched, error=RuntimeError(
+                    f"Job {watched.job_id} is taking unusually long to schedule."))
+                return
+            watched.next_poll_at = now + watched.scheduler.unscheduled()
+            return
+
+        if isinstance(status, Exception):
+            self._finish(watched, error=status)
+            return
+
+        watched.unscheduled_since = None
+        if watched.first_response_at is None:
+            watched.first_response_at = now
+
+        new_items = self._sdk._consume_job_status(
+            watched.progress, status,
+            raw_log_level=watched.raw_log_level,
+            log_summaries_dest=watched.log_summaries_dest,
+            intermediate_items_dest=watched.intermediate_items_dest)
+
+        if new_items is None:
+            if now - watched.first_response_at > self.MAX_WAIT_FOR_CHANGE_MINUTES * 60:
+                self._finish(watched, error=RuntimeError(
+                    "This job is taking too long - please retry."))
+                return
+            new_items = []
+
+        for item in new_items:
+            watched.items.append(item)
+            watched.queue.put(item)
+            if watched.on_item is not None:
+                watched.on_item(item)
+
+        if watched.progress.done:
+            self._finish(watched)
+            return
+
+        watched.next_poll_at = now + watched.scheduler.next_delay(
+            len(new_items), hint=status.get('pollInterval'))
+
+    def _finish(self, watched: WatchedJob, error: Optional[BaseException] = None):
+        with self._cond:
+            if watched.job_id is not None:
+                self._jobs.pop(watched.job_id, None)
+        if watched.job_id is not None:
+            self._sdk._job_finished(watched.job_id)
+        if not watched.future.done():
+            if error is None and watched.on_done is not None:
+                try:
+                    watched.on_done(watched.items)
+                except Exception as e:
+                    error = e
+            if error is not None:
+                watched.future.set_exception(error)
+            else:
+                watched.future.set_result([Item(i) for i in watched.items])
+        watched.queue.put(self.DONE)
+
+    def close(self):
+        """Stop polling.  Jobs still being watched are left running on the
+        server, and their futures are cancelled."""
+        with self._cond:
+            self._closed = True
+            remaining = list(self._jobs.values())
+            remaining.extend(watched for watched, _ in self._waiting)
+            self._jobs.clear()
+            self._waiting.clear()
+            self._cond.notify_all()
+        for watched in remaining:
+            watched.future.cancel()
+            watched.queue.put(self.DONE)
+
+
+class _NotScheduled:
+    """Marks a job whose status isn't available yet."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
@@ -1,17 +1,22 @@
 import os
+import asyncio
 import copy
+import collections
 import json
-import csv
 from typing import Optional, Dict, Any, List, Generator, Union
 import logging
 import concurrent.futures
+import functools
 
 from .item import Item
+from .results import ResultSnapshot, ResultStore
+from .cache import workflow_digest
+from .sharding import AsyncShardedRun, ShardedRun
+from .export import (
+    WRITERS, ResumeLog, export_format, supported_extensions, writer_for)
 
 class Workflow:
 
-    _executor = concurrent.futures.ThreadPoolExecutor()
-
     def __init__(self, sdk_context):
 
         self._sdk = sdk_context
@@ -25,13 +30,25 @@ class Workflow:
         self._ran_job_id = None
         self._future = None
 
-        self._last_job = {
-            'log_summaries': [],
-            'intermediate_items': [],
-            'log_summaries_yielded_s': set()
-        }
+        self._keep_log_summaries = True
+        self._keep_intermediate_items = True
+        self._max_log_summaries = None
+        self._max_intermediate_items = None
+        self._reset_last_job()
 
         self._raw_log_level = self._sdk._LOG_LEVELS['error']
+        self._poll_min_interval = None
+        self._poll_max_interval = None
+
+        self._shard_size = None
+        self._shard_concurrency = None
+        self._shard_ordered = True
+        self._ran_job_ids = []
+        self._params = None
+        # None until run, then "running", "partial" (interrupted, can be
+        # resumed), "stopped" (by us, before it was done) or "complete"
+        self._job_state = None
+        self._progress = None
 
     def set_log_level(self, log_level_string):
         """
@@ -51,15 +68,135 @@ class Workflow:
         """
         self._raw_log_level = self._sdk._LOG_LEVELS[log_level_string]
 
+    def _reset_last_job(self):
+        # deques with maxlen act as ring buffers; maxlen=None is unbounded
+        self._last_job = {
+            'log_summaries': collections.deque(maxlen=self._max_log_summaries),
+            'intermediate_items': collections.deque(
+                maxlen=self._max_intermediate_items),
+            'log_summaries_yielded_s': set()
+        }
+
+    def set_job_details(self, log_summaries=True, intermediate_items=True,
+            max_log_summaries=None, max_intermediate_items=None):
+        """
+        Choose which job details, besides the results, are requested from the
+        server and kept on this workflow while its job runs.
+
+        Intermediate items (the output of every step, not just the last) and
+        log summaries can be large for big jobs.  Turning them off means they
+        aren't requested from the server, parsed, or retained.  When kept,
+        they can be limited to the most recent N entries.
+
+        Must be set before the job runs.
+
+        Args:
+            log_summaries: keep log summaries, see `get_new_log_summaries()`
+            intermediate_items: keep the items produced by intermediate steps
+            max_log_summaries: keep only this many of the latest log summaries
+            max_intermediate_items: keep only this many of the latest intermediate items
+        """
+        self._keep_log_summaries = log_summaries
+        self._keep_intermediate_items = intermediate_items
+        self._max_log_summaries = max_log_summaries
+        self._max_intermediate_items = max_intermediate_items
+        self._reset_last_job()
+
+    def set_poll_interval(self, min_interval=None, max_interval=None):
+        """
+        Override how often the status of jobs spawned from this workflow is
+        polled.  By default, the intervals configured on the FetchFox client
+        are used.
+
+        Polling is fastest (`min_interval`) while results are arriving and
+        slows down towards `max_interval` while the job is idle or not yet
+        scheduled.
+
+        Must be set before the job runs.
+
+        Args:
+            min_interval: shortest wait between polls, in seconds
+            max_interval: longest wait between polls, in seconds
+        """
+        self._poll_min_interval = min_interval
+        self._poll_max_interval = max_interval
+
+    def set_sharding(self, shard_size=None, max_concurrency=None, ordered=True):
+        """
+        Split a large input list into several smaller jobs.
+
+        When this workflow starts from a list of items (from `init()` with
+        many URLs, or from the results of another workflow), and that list
+        is longer than `shard_size`, the workflow is run as one job per
+        `shard_size` items, at most `max_concurrency` at a time.  Their
+        results are merged into one stream.
+
+        Steps which look at all items together, such as `unique()`, only
+        see the items of their own job.  A `limit()` is applied to the
+        merged results as well.
+
+        By default, the `shard_size` and `shard_concurrency` configured on
+        the FetchFox client are used.  Must be set before the job runs.
+
+        Args:
+            shard_size: max input items per job.  None for no sharding.
+            max_concurrency: max jobs running at once
+            ordered: yield results in input order, shard by shard.  Set to False to yield results as soon as they arrive from any job.
+        """
+        self._shard_size = shard_size
+        self._shard_concurrency = max_concurrency
+        self._shard_ordered = ordered
+
+    def _shard_size_for_run(self) -> Optional[int]:
+        """The shard size, if this workflow should be sharded."""
+        shard_size = self._shard_size
+        if shard_size is None:
+            shard_size = getattr(self._sdk, 'shard_size', None)
+        steps = self._workflow["steps"]
+        if not shard_size or not steps or steps[0]["name"] != "const":
+            return None
+        if len(steps[0]["args"]["items"]) <= shard_size:
+            return None
+        return shard_size
+
+    def _shard_concurrency_for_run(self) -> int:
+        concurrency = self._shard_concurrency
+        if concurrency is None:
+            concurrency = getattr(self._sdk, 'shard_concurrency', 4)
+        return concurrency
+
+    def _shards(self) -> Optional[List["Workflow"]]:
+        """The workflows to run instead of this one, if it should be
+        sharded."""
+        shard_size = self._shard_size_for_run()
+        if shard_size is None:
+            return None
+        steps = self._workflow["steps"]
+        items = steps[0]["args"]["items"]
+
+        shards = []
+        for start in range(0, len(items), shard_size):
+            shard = Workflow(self._sdk)
+            first_step = dict(steps[0],
+                args=dict(steps[0]["args"], items=items[start:start + shard_size]))
+            shard._workflow = dict(self._workflow,
+                steps=[first_step] + copy.deepcopy(steps[1:]),
+                options=copy.deepcopy(self._workflow["options"]))
+            shard._params = self._params
+            shards.append(shard)
+        return shards
+
     @property
     def all_results(self):
         """Get all results, executing the query if necessary, blocks until done.
         Returns results as Item objects for easier attribute access.
         """
+        return self._ensure_results().views()
+
+    def _ensure_results(self) -> ResultStore:
         if not self.has_results:
             self._run__block_until_done() # writes to self._results
-
-        return [Item(item) for item in self._results]
+        return self._results
 
     def results(self):
         yield from self._results_gen()
@@ -67,17 +204,33 @@ class Workflow:
     @property
     def has_results(self):
         """If you want to check whether a workflow has results already, but
-        do NOT want to trigger execution yet."""
+        do NOT want to trigger execution yet.
+
+        Only complete results count: not those of a job which is still
+        running, or whose results were interrupted or stopped early."""
         if self._results is None:
             return False
-        return True
+        return self._job_state not in ("running", "partial", "stopped")
+
+    @property
+    def job_state(self) -> Optional[str]:
+        """The state of this workflow's results:
+
+        - None: not run yet
+        - "running": results are being received
+        - "partial": receiving results was interrupted, e.g. by a network error.  The job is left running, and iterating again continues where it stopped, without re-running the workflow.
+        - "stopped": iteration ended early, and the job was stopped.  Getting the results again re-runs the workflow.  This includes an exception raised by your own code in the body of a `for item in workflow` loop: Python closes the iteration then, which can't be told apart from a `break`.
+        - "complete": all results were received
+        - "exported": all results were written by `export()`, without keeping them (`keep_results=False`, or `resume=True`).  Getting the results, or deriving a workflow, fetches them again from the same job, without re-running the workflow.
+        """
+        return self._job_state
 
     @property
     def has_run(self):
         """If this workflow has been executed before (even if there were no
         results)
         """
-        if self._ran_job_id is not None:
+        if self._ran_job_id is not None or any(self._ran_job_ids):
             return True
         return False
 
@@ -97,31 +250,38 @@ class Workflow:
         Args:
             key: Can be an integer index or a slice
         """
-        # Results property already returns Items
-        return self.all_results[key]
+        results = self._ensure_results()
+        if isinstance(key, slice):
+            return [results.view(i) for i in range(*key.indices(len(results)))]
+        return results.view(key)
 
     def __bool__(self):
         """Return True if the workflow has any results, False otherwise.
         Accessing the results property will execute the workflow if necessary.
         """
-        return bool(self.all_results)
+        return len(self._ensure_results()) > 0
 
     def __len__(self):
         """Return the number of results.
         Accessing the results property will execute the workflow if necessary.
         """
-        return len(self.all_results)
+        return len(self._ensure_results())
 
     def __contains__(self, item):
         """Check if an item exists in the results.
         Accessing the results property will execute the workflow if necessary.
         """
-        return item in self.all_results
+        return item in self._ensure_results()
 
     def _clone(self):
         """Create a new instance with copied workflow OR copied results"""
-        # check underlying, not property, because we don't want to trigger exec
-        if self._results is None or len(self._results) < 1:
+        # has_results doesn't trigger exec.  Incomplete results aren't used.
+        if self._resumable():
+            # The results weren't kept (e.g. by export()), or are partial,
+            # but the job has them all: rather than running the steps again
+            # for the new workflow, fetch them
+            self._ensure_results()
+        if not self.has_results or len(self._results) < 1:
             # If there are no results, we are extending the steps of this workflow
             # so that, when it runs, we'll produce the desired results
             if self._ran_job_id is not None:
@@ -130,6 +290,7 @@ class Workflow:
 
             new_instance = Workflow(self._sdk)
             new_instance._workflow = copy.deepcopy(self._workflow)
+            new_instance._params = self._params
             return new_instance
         else:
             # We purportedly have more than zero results:
@@ -143,9 +304,10 @@ class Workflow:
                 {
                     "name": "const",
                     "args": {
-                        "items": copy.deepcopy(self._results)
-                        # We use the internal _results field, because it's a
-                        # list of dictionaries rather than Items
+                        # Shared by all the derived workflows, not copied
+                        "items": self._results.snapshot(job_id=(
+                            self._ran_job_id
+                            if len(self._ran_job_ids) <= 1 else None))
                     }
                 }
             ]
@@ -171,27 +333,347 @@ class Workflow:
         """
 
         self._sdk.logger.debug("Streaming Results")
-        if not self.has_results:
-            self._results = []
+        if self._resumable():
+            yield from self._resume_job()
+        elif not self.has_results and not self._load_cached_results():
+            self._results = ResultStore()
+            shards = self._shards()
+            if shards is not None:
+                yield from self._follow_shards(shards)
+                return
             job_id = self._sdk._run_workflow(workflow=self)
-            self._ran_job_id = job_id #track that we have ran
-            for item in self._sdk._job_result_items_gen(
-                        job_id,
-                        raw_log_level=self._raw_log_level,
-                        log_summaries_dest=self._last_job['log_summaries'],
-                        intermediate_items_dest=self._last_job['intermediate_items']):
+            yield from self._follow_job(job_id)
+        else:
+            yield from self.all_results #yields Items
 
+    def _follow_shards(self, shards):
+        """Run the shards of this workflow, and yield their merged results,
+        attaching them to the workflow."""
+        concurrency = self._shard_concurrency_for_run()
+        run = ShardedRun(self._sdk, shards,
+            max_concurrency=concurrency,
+            ordered=self._shard_ordered,
+            stream_kwargs=self._job_stream_kwargs())
+        self._sdk.logger.info(
+            "Running workflow as %d jobs, %d at a time", len(shards), concurrency)
+
+        self._results = ResultStore()
+        self._ran_job_ids = run.job_ids # filled in as the jobs start
+        self._job_state = "running"
+        try:
+            for item in run:
                 self._results.append(item)
                 yield Item(item)
+                if self._limit_reached():
+                    break
+        except GeneratorExit:
+            self._stopped_early()
+            raise
+        except BaseException:
+            # Several jobs can't be resumed as one: this state only means
+            # the results are incomplete
+            self._job_state = "partial"
+            raise
+        finally:
+            run.close(stop_jobs=self._stop_abandoned_jobs())
+            self._ran_job_id = next(
+                (job_id for job_id in run.job_ids if job_id), None)
+        self._job_state = "complete"
+        self._store_cached_results()
+
+    def _follow_job(self, job_id, progress=None, keep_results=True):
+        """Yield the results of this workflow's job as they arrive, attaching
+        them to the workflow.  With `progress`, continue following the job
+        the results so far came from.  Without `keep_results`, the results
+        are only yielded."""
+        if progress is None:
+            progress = self._start_job(job_id)
+            if not keep_results:
+                self._results = None
+        self._job_state = "running"
+        items = self._sdk._job_result_items_gen(
+            job_id, progress=progress, **self._job_stream_kwargs())
+        try:
+            for item in items:
+                if keep_results:
+                    self._results.append(item)
+                yield Item(item)
+                if self._limit_reached():
+                    break
+        except GeneratorExit:
+            self._stopped_early()
+            raise
+        except BaseException:
+            self._job_state = "partial"
+            raise
+        finally:
+            # Stop the job before closing `items` gives up its job slot.
+            # A partial job keeps running, so it can be resumed.
+            if self._should_stop_job():
+                self._stop_jobs([job_id])
+            items.close()
+        if not keep_results:
+            self._job_state = "exported"
+            return
+        self._job_state = "complete"
+        self._store_cached_results()
+
+    def _start_job(self, job_id):
+        """Attach a newly started job to the workflow, with no results yet.
+        Returns the JobProgress to follow it with."""
+        self._results = ResultStore()
+        self._ran_job_id = job_id #track that we have ran
+        self._ran_job_ids = [job_id]
+        self._progress = self._new_progress(job_id)
+        return self._progress
+
+    def _new_progress(self, job_id):
+        stream_kwargs = self._job_stream_kwargs()
+        return self._sdk._new_job_progress(job_id,
+            raw_log_level=stream_kwargs['raw_log_level'],
+            log_summaries_dest=stream_kwargs['log_summaries_dest'],
+            intermediate_items_dest=stream_kwargs['intermediate_items_dest'])
+
+    def _resumable(self) -> bool:
+        if self._job_state not in ("partial", "exported"):
+            return False
+        return len(self._ran_job_ids) == 1 and self._ran_job_id is not None
+
+    def _resume_progress(self):
+        """A JobProgress for continuing the interrupted job, which skips the
+        items we already have."""
+        if self._results is None:
+            # None were kept, e.g. by export()
+            self._results = ResultStore()
+        ids = set()
+        for item in self._results.views():
+            meta = item.get('_meta')
+            if isinstance(meta, dict) and 'id' in meta:
+                ids.add(meta['id'])
+
+        progress = self._progress
+        if progress is None or progress.seen_ids != ids:
+            # Some items were received but never made it into the results,
+            # e.g. the rest of a batch when iteration was interrupted, so the
+            # cursor is past them: start over, skipping what we have.
+            progress = self._new_progress(self._ran_job_id)
+            progress.seen_ids.update(ids)
+            self._progress = progress
+        return progress
+
+    def _resume_job(self):
+        """Yield the results we have, then the rest of the job's results."""
+        progress = self._resume_progress()
+        self._sdk.logger.info("Resuming job %s after %d results",
+            self._ran_job_id, len(self._results))
+        yield from self._results.views()
+        yield from self._follow_job(self._ran_job_id, progress=progress)
+
+    def _should_stop_job(self) -> bool:
+        """Whether following the job ended with it still wanted to stop."""
+        if self._job_state == "stopped":
+            return True
+        return self._job_state != "partial" and self._limit_reached()
+
+    def _limit_reached(self) -> bool:
+        limit = self._workflow["options"].get("limit")
+        return (limit is not None and self._results is not None
+            and len(self._results) >= limit)
+
+    def _stop_abandoned_jobs(self) -> bool:
+        return getattr(self._sdk, 'stop_abandoned_jobs', True)
+
+    def _stop_jobs(self, job_ids):
+        """Stop this workflow's jobs which are still running, as their
+        results are no longer wanted."""
+        if not self._stop_abandoned_jobs():
+            return
+        for job_id in job_ids:
+            if job_id:
+                self._sdk._stop_job(job_id)
+
+    def _stopped_early(self):
+        """Iteration over the results ended before the job(s) were done.
+        The results so far stay attached to the workflow."""
+        if self._limit_reached():
+            self._job_state = "complete"
+            return
+        self._job_state = "stopped"
+        if self._results is not None:
+            self._sdk.logger.info(
+                "Stopped early, with %d results", len(self._results))
+
+    def _result_cache(self):
+        return getattr(self._sdk, '_result_cache', None)
+
+    def _load_cached_results(self) -> bool:
+        """Attach results from the SDK's result cache, if it has results
+        for an identical workflow."""
+        cache = self._result_cache()
+        if cache is None:
+            return False
+        items = cache.get(self._results_digest())
+        if items is None:
+            return False
+        self._sdk.logger.info("Using %d cached results", len(items))
+        self._results = ResultStore(items)
+        self._job_state = "complete"
+        return True
+
+    def _store_cached_results(self):
+        cache = self._result_cache()
+        if cache is not None and self._results is not None:
+            cache.put(self._results_digest(), self._results.to_list())
+
+    def _results_digest(self) -> str:
+        """Key of this workflow's results in the result cache.  Unlike the
+        workflow's own digest, this depends on the params."""
+        digest = self._sdk._workflow_digest(self)
+        if self._params:
+            digest = workflow_digest(self._params, namespace=digest)
+        return digest
+
+    def _job_stream_kwargs(self):
+        """Per-workflow options for following this workflow's job."""
+        return dict(
+            raw_log_level=self._raw_log_level,
+            log_summaries_dest=(
+                self._last_job['log_summaries']
+                if self._keep_log_summaries else None),
+            intermediate_items_dest=(
+                self._last_job['intermediate_items']
+                if self._keep_intermediate_items else None),
+            poll_min_interval=self._poll_min_interval,
+            poll_max_interval=self._poll_max_interval)
+
+    def _require_async_sdk(self):
+        if not hasattr(self._sdk, '_ajob_result_items_gen'):
+            raise TypeError(
+                "Async iteration requires a workflow created from an "
+                "AsyncFetchFox client.")
+
+    async def _results_agen(self):
+        """Async counterpart of _results_gen."""
+        self._require_async_sdk()
+        self._sdk.logger.debug("Streaming Results")
+        if self._resumable():
+            job_id = self._ran_job_id
+            progress = self._resume_progress()
+            for item in self._results.views():
+                yield item
+        elif not self.has_results and not self._load_cached_results():
+            shards = self._shards()
+            if shards is not None:
+                sharded = self._afollow_shards(shards)
+                try:
+                    async for item in sharded:
+                        yield item
+                finally:
+                    # Unlike `yield from`, this doesn't close it for us
+                    await sharded.aclose()
+                return
+            job_id = await self._sdk._arun_workflow(workflow=self)
+            progress = self._start_job(job_id)
         else:
-            yield from self.all_results #yields Items
+            for item in self.all_results:
+                yield item
+            return
+
+        self._job_state = "running"
+        items = self._sdk._ajob_result_items_gen(
+            job_id, progress=progress, **self._job_stream_kwargs())
+        try:
+            async for item in items:
+                self._results.append(item)
+                yield Item(item)
+                if self._limit_reached():
+                    break
+        except GeneratorExit:
+            self._stopped_early()
+            raise
+        except BaseException:
+            self._job_state = "partial"
+            raise
+        finally:
+            if self._should_stop_job() and self._stop_abandoned_jobs():
+                await self._sdk._astop_job(job_id)
+            await items.aclose()
+        self._job_state = "complete"
+        self._store_cached_results()
+
+    async def _afollow_shards(self, shards):
+        """Async counterpart of _follow_shards."""
+        run = AsyncShardedRun(self._sdk, shards,
+            max_concurrency=self._shard_concurrency_for_run(),
+            ordered=self._shard_ordered,
+            stream_kwargs=self._job_stream_kwargs())
+        self._sdk.logger.info("Running workflow as %d jobs, %d at a time",
+            len(shards), run.max_concurrency)
+
+        self._results = ResultStore()
+        self._ran_job_ids = run.job_ids # filled in as the jobs start
+        self._job_state = "running"
+        merged = run.tagged()
+        try:
+            async for _, item in merged:
+                self._results.append(item)
+                yield Item(item)
+                if self._limit_reached():
+                    break
+        except GeneratorExit:
+            self._stopped_early()
+            raise
+        except BaseException:
+            self._job_state = "partial"
+            raise
+        finally:
+            await merged.aclose()
+            await run.aclose(stop_jobs=self._stop_abandoned_jobs())
+            self._ran_job_id = next(
+                (job_id for job_id in run.job_ids if job_id), None)
+        self._job_state = "complete"
+        self._store_cached_results()
+
+    def __aiter__(self):
+        """Iterate over results with `async for`, as they arrive.
+        Requires an AsyncFetchFox client."""
+        return self._results_agen()
+
+    async def all_results_async(self):
+        """Async counterpart of `all_results`: run the workflow if necessary,
+        without blocking the event loop, and return all results as Items."""
+        if not self.has_results:
+            async for _ in self._results_agen():
+                pass
+        return self._results.views()
+
+    async def export_async(self, filename: str, overwrite: bool = False,
+            **writer_options) -> dict:
+        """Async counterpart of `export()`.  The workflow runs on the event
+        loop; the file is written in the default executor.
+
+        Args:
+            filename: Path to output file, with an extension supported by `export()`
+            overwrite: Defaults to False, which causes an error to be raised if the file exists already.  Set it to true if you want to overwrite.
+            writer_options: passed to the writer, as with `export()`
+        """
+        await self.all_results_async()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(
+            self.export, filename, overwrite=overwrite, **writer_options))
 
     def get_new_log_summaries(self):
+        logs = self._last_job['log_summaries']
+        yielded = self._last_job['log_summaries_yielded_s']
         new_logs = []
-        for log in self._last_job['log_summaries']:
-            if log not in self._last_job['log_summaries_yielded_s']:
+        for log in logs:
+            if log not in yielded:
                 new_logs.append(log)
-                self._last_job['log_summaries_yielded_s'].add(log)
+                yielded.add(log)
+        if len(yielded) > len(logs):
+            # Forget those which fell out of the ring buffer, so that this
+            # is bounded by it too
+            self._last_job['log_summaries_yielded_s'] = set(logs)
         return new_logs
 
     def _future_done_cb(self, future):
@@ -201,10 +683,26 @@ class Workflow:
         otherwise, we can handle exceptions.
         """
         if not future.cancelled():
-            self._results = future.result()
+            self._results = ResultStore(future.result())
         else:
             self._future = None
 
+    def _watched_done_cb(self, future):
+        """Done-callback for futures from the SDK's job watcher.  Results
+        were already attached by _watched_results_cb."""
+        if future.cancelled() or future.exception() is not None:
+            self._future = None
+
+    def _watched_results_cb(self, items):
+        # Keep the plain dicts, like _results_gen does.  This runs before
+        # the future resolves, so results are attached by then.
+        self._results = ResultStore(items)
+        self._job_state = "complete"
+        self._store_cached_results()
+
+    def _set_ran_job_id(self, job_id):
+        self._ran_job_id = job_id
+
     def results_future(self):
         """Returns a plain concurrent.futures.Future object that yields ALL results
         when the job is complete.  Access the_future.result() to block, or use
@@ -214,17 +712,31 @@ class Workflow:
         `future.result()`
         """
 
-        if self._results is not None:
+        if self.has_results or self._load_cached_results():
             # Already have final results: return a completed future
             completed_future = concurrent.futures.Future()
-            completed_future.set_result(self._results)
+            completed_future.set_result(self._results.to_list())
             self._future = completed_future
 
         if self._future is not None:
             # Already started, so reuse existing future
             return self._future
 
-        self._future = self._executor.submit(self._run__block_until_done)
+        watcher = getattr(self._sdk, '_watcher', None)
+        if (watcher is not None and self._shard_size_for_run() is None
+                and not self._resumable()):
+            # One shared poller follows all the jobs, instead of a thread each
+            watched = watcher.watch(
+                start=lambda job_slot: self._sdk._run_workflow(
+                    workflow=self, job_slot=job_slot),
+                on_started=self._set_ran_job_id,
+                on_done=self._watched_results_cb,
+                **self._job_stream_kwargs())
+            self._future = watched.future
+            self._future.add_done_callback(self._watched_done_cb)
+            return self._future
+
+        self._future = self._sdk._submit(self._run__block_until_done)
         self._future.add_done_callback(self._future_done_cb)
         return self._future
 
@@ -259,58 +771,213 @@ class Workflow:
         })
         return new_instance
 
-    def configure_params(self, params) -> "Workflow":
-        raise NotImplementedError()
+    def configure_params(self, params: dict) -> "Workflow":
+        """
+        Get a copy of this workflow which runs with the given parameters.
 
-    def export(self, filename: str, overwrite: bool = False) -> None:
+        E.g. if the workflow has a `{{state_name}}` parameter:
+
+            workflow.configure_params({"state_name": "Alaska"})
+
+        To run the same workflow for many sets of parameters, see
+        `FetchFox.map()`.
+
+        Args:
+            params: parameter values, by name.  These are added to any which were configured already.
+        """
+        if not isinstance(params, dict):
+            raise ValueError("params must be a dictionary")
+        new_instance = Workflow(self._sdk)
+        new_instance._workflow = copy.deepcopy(self._workflow)
+        new_instance._params = dict(self._params or {}, **params)
+        return new_instance
+
+    def export(self, filename: str, overwrite: bool = False,
+            resume: bool = False, keep_results: bool = True,
+            **writer_options) -> dict:
         """Execute workflow and save results to file.
 
+        Items are written as they arrive from the job.  They go to a
+        temporary file, which is renamed to `filename` once complete, so an
+        interrupted export never leaves a truncated file behind.  For CSV,
+        Parquet and Arrow, the columns are the item template of the extract
+        step, plus `_meta`; any other fields are put in an `_extra` column,
+        as JSON.
+
+        The results are also attached to the workflow, compactly, so that
+        workflows derived from it start from them.  With
+        `keep_results=False`, they are only written, and never all in
+        memory; getting the workflow's results afterwards, or deriving a
+        workflow from it, fetches them from the same job again.
+
+        With `resume=True`, an interrupted export can be continued: the
+        partial file is kept as `filename + ".part"`, along with a
+        `filename + ".resume"` log of the job ID and the items written.
+        Exporting the same workflow to the same filename again, with
+        `resume=True`, follows the same job and only appends the missing
+        items, instead of running the workflow again.  The job is run
+        detached, so that an interruption, even Ctrl-C, leaves it running.
+        The results are not kept, as with `keep_results=False`.
+        Not available for Parquet and Arrow.
+
+        JSONL and CSV may be compressed, by adding .gz or .zst to the
+        filename (e.g. `results.jsonl.gz`).  .zst needs the optional
+        zstandard package: `pip install fetchfox-sdk[zstd]`.  JSONL is encoded
+        with orjson, when it's installed.
+
+        Parquet (.parquet) and Arrow IPC (.arrow or .feather) need the
+        optional pyarrow package: `pip install fetchfox-sdk[arrow]`
+
         Args:
-            filename: Path to output file, must end with .csv or .jsonl
+            filename: Path to output file, must end with .csv, .jsonl, .parquet, .arrow or .feather, optionally followed by .gz or .zst for CSV and JSONL
             overwrite: Defaults to False, which causes an error to be raised if the file exists already.  Set it to true if you want to overwrite.
+            resume: keep track of progress, and continue an interrupted export if there was one
+            keep_results: attach the results to the workflow, as well as writing them
+            writer_options: passed to the writer, e.g. `compresslevel=` for .gz and .zst, or `batch_size=` (rows per row group) and `compression=` for Parquet and Arrow
+
+        Returns:
+            Export stats, e.g. {"filename": ..., "format": "jsonl", "codec": "gzip", "items": 12, "bytes": 3456}
 
         Raises:
-            ValueError: If filename doesn't end with .csv or .jsonl
+            ValueError: If filename doesn't have a supported extension
             FileExistsError: If file exists and overwrite is False
         """
 
-        if not (filename.endswith('.csv') or filename.endswith('.jsonl')):
-            raise ValueError("Output filename must end with .csv or .jsonl")
+        extension = export_format(filename)
+        if extension is None:
+            raise ValueError(
+                "Output filename must end with one of: "
+                + ", ".join(supported_extensions()))
 
         if os.path.exists(filename) and not overwrite:
             raise FileExistsError(
                 f"File {filename} already exists. Use overwrite=True to overwrite.")
 
-        if self.has_run:
+        if self.has_run and self._job_state in (None, "complete"):
             if not self.has_results:
                 raise RuntimeError("A job ran, but there are no results.")
 
             # If it has run, and results is not None, results could still be []
             # anyway, accessing it here won't trigger another run
-            if len(self.all_results) < 1:
+            if len(self._results) < 1:
                 if os.path.exists(filename) and overwrite:
                     raise RuntimeError("No results.  Refusing to overwrite.")
                 else:
                     self._sdk.logger.warn("No results to export.")
 
-        # Now we access the magic property, so execution will occur if needed
-        raw_results = [ dict(result_item) for result_item in self.all_results ]
-
-        if filename.endswith('.csv'):
-            fieldnames = set()
-            for item in raw_results:
-                fieldnames.update(item.keys())
-
-            with open(filename, 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=sorted(fieldnames))
-                writer.writeheader()
-                writer.writerows(raw_results)
-
+        if WRITERS[extension].needs_fieldnames:
+            if self.has_results:
+                writer_options.setdefault(
+                    'fieldnames', sorted(self._results.fieldnames()))
+                writer_options.setdefault('extra_field', None)
+            elif self._item_template() is not None:
+                # Items from the server always carry _meta
+                fieldnames = list(self._item_template())
+                if '_meta' not in fieldnames:
+                    fieldnames.append('_meta')
+                writer_options.setdefault('fieldnames', fieldnames)
+            else:
+                # No way to know the columns up front: run to completion first
+                self._ensure_results()
+                return self.export(
+                    filename, overwrite=overwrite, **writer_options)
+
+        if resume and not self.has_results:
+            return self._export_resumable(filename, extension, writer_options)
+
+        writer = writer_for(filename, **writer_options)
+        with writer:
+            # Runs the workflow if needed, writing items as they arrive
+            writer.write_all(self._export_items(keep_results))
+        return writer.stats()
+
+    def _export_items(self, keep_results=True):
+        """The results to write.  Without `keep_results`, those which
+        aren't here yet are only written, not attached to the workflow."""
+        if (keep_results or self.has_results or self._load_cached_results()
+                or self._shard_size_for_run() is not None):
+            return self._results_gen()
+        if self._resumable():
+            # Fetch them all from the job again
+            job_id = self._ran_job_id
         else:
-            with open(filename, 'w') as f:
-                for item in raw_results:
-                    f.write(json.dumps(item) + '\n')
+            job_id = self._sdk._run_workflow(workflow=self)
+        return self._follow_job(job_id, keep_results=False)
 
+    def _export_resumable(self, filename, extension, writer_options) -> dict:
+        if not WRITERS[extension].appendable:
+            raise ValueError(
+                f"Resumable export isn't supported for {extension} files")
+        if self._shard_size_for_run() is not None:
+            raise ValueError(
+                "Resumable export isn't supported for sharded workflows")
+
+        part_path = filename + ".part"
+        log = ResumeLog(filename + ".resume")
+        digest = self._sdk._workflow_digest(self)
+        state = log.load()
+        if state is not None and state.get("workflow") != digest:
+            self._sdk.logger.warning(
+                "%s is from exporting another workflow.  Starting over.", log.path)
+            state = None
+        if state is not None and not os.path.exists(part_path):
+            state = None
+
+        # The job is detached, so that neither Ctrl-C nor an error here
+        # stops it: the next export picks it up where this one stopped
+        if state is not None:
+            job_id = state["job_id"]
+            self._sdk.logger.info(
+                "Resuming export of job %s after %d items",
+                job_id, len(state["ids"]))
+            writer = writer_for(filename, path=part_path,
+                offset=state["offset"], on_checkpoint=log.checkpoint,
+                **writer_options)
+            # Compacts the log, and drops any checkpoint cut short
+            log.start(job_id, digest, state["offset"], state["ids"])
+
+            progress = self._new_progress(job_id)
+            progress.seen_ids.update(state["ids"])
+        else:
+            writer = writer_for(filename, path=part_path,
+                on_checkpoint=log.checkpoint, **writer_options)
+            if self._resumable():
+                # Exported before, or interrupted: the job has the results
+                job_id = self._ran_job_id
+            else:
+                job_id = self._sdk._run_workflow(workflow=self, detached=True)
+            log.start(job_id, digest)
+            progress = self._new_progress(job_id)
+
+        # As with keep_results=False, the results aren't kept
+        self._results = None
+        self._ran_job_id = job_id
+        self._ran_job_ids = [job_id]
+        self._progress = progress
+        self._job_state = "running"
+        items = self._sdk._job_result_items_gen(
+            job_id, progress=progress, **self._job_stream_kwargs())
+
+        try:
+            with writer:
+                writer.write_all(items)
+        except BaseException:
+            self._job_state = "partial"
+            raise
+        log.remove()
+        self._job_state = "exported"
+        return writer.stats()
+
+    def _item_template(self) -> Optional[dict]:
+        """The item template of the step which produces this workflow's
+        items, if that is an extract step."""
+        for step in reversed(self._workflow["steps"]):
+            if step["name"] in ("filter", "limit", "unique"):
+                continue
+            if step["name"] == "extract":
+                return step["args"]["questions"]
+            return None
+        return None
 
     def extract(self, item_template: dict, per_page=None, view=None,
             limit=None, max_pages=1) -> "Workflow":
@@ -491,9 +1158,50 @@ class Workflow:
 
         return new_instance
 
+    def _map_snapshots(self, fn, reference=False) -> Dict[str, Any]:
+        """The workflow, with each const step's ResultSnapshot replaced by
+        fn(snapshot).  With `reference`, const steps of results from a job
+        instead refer to that job, and fn is not used for them."""
+        steps = []
+        for step in self._workflow["steps"]:
+            items = step["args"].get("items") if step["name"] == "const" else None
+            if isinstance(items, ResultSnapshot):
+                args = dict(step["args"])
+                if reference and items.job_id is not None:
+                    del args["items"]
+                    args["job"] = items.job_id
+                else:
+                    args["items"] = fn(items)
+                step = dict(step, args=args)
+            steps.append(step)
+        return dict(self._workflow, steps=steps)
+
+    def _has_result_references(self) -> bool:
+        """Whether this workflow starts from the results of another job."""
+        return any(
+            isinstance(step["args"].get("items"), ResultSnapshot)
+                and step["args"]["items"].job_id is not None
+            for step in self._workflow["steps"] if step["name"] == "const")
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert workflow to dictionary format."""
-        return self._workflow
+        return self._map_snapshots(lambda snapshot: snapshot.to_list())
+
+    def to_json(self, reference: bool = False) -> str:
+        """Encode the workflow as JSON.
 
-    def to_json(self):
-        return json.dumps(self._workflow)
+        Args:
+            reference: refer to the jobs whose results this workflow starts from, instead of including those results
+        """
+        # Splice in each snapshot's cached JSON, rather than encoding the
+        # same results again for every derived workflow
+        encoded = {}
+        def placeholder(snapshot):
+            key = f"\x00snapshot-{id(snapshot)}\x00"
+            encoded[json.dumps(key)] = snapshot.to_json()
+            return key
+
+        text = json.dumps(self._map_snapshots(placeholder, reference=reference))
+        for key, snapshot_json in encoded.items():
+            text = text.replace(key, snapshot_json)
+        return text
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from fetchfox_sdk import AsyncFetchFox
+
+
+def _item(i):
+    return {"name": f"item {i}", "_meta": {"id": f"id_{i}"}}
+
+
+def _mock_fox(handler):
+    fox = AsyncFetchFox(api_key="test_key", host="http://127.0.0.1",
+        poll_min_interval=0.01, poll_max_interval=0.05)
+    fox._aclient = httpx.AsyncClient(
+        base_url=fox.base_url, transport=httpx.MockTransport(handler))
+    return fox
+
+
+def test_async_iteration_streams_results():
+    polls = []
+
+    def handler(request):
+        path = request.url.path
+        if path.endswith("/workflows"):
+            return httpx.Response(200, json={"id": "wf_1"})
+        if path.endswith("/workflows/wf_1/run"):
+            return httpx.Response(200, json={"jobId": "job_1"})
+        if path.endswith("/jobs/job_1"):
+            polls.append(request)
+            if len(polls) == 1:
+                return httpx.Response(404)
+            if len(polls) == 2:
+                return httpx.Response(200, json={
+                    "done": False, "results": {"items": [_item(1)]}})
+            return httpx.Response(200, json={
+                "done": True, "results": {"items": [_item(1), _item(2)]}})
+        return httpx.Response(500)
+
+    async def run():
+        async with _mock_fox(handler) as fox:
+            workflow = fox.extract("https://example.com", {"name": "The name"})
+            names = [item.name async for item in workflow]
+            assert names == ["item 1", "item 2"]
+            # Results are attached, so this doesn't run the job again
+            assert await workflow.all_results_async() == [_item(1), _item(2)]
+        # The sync side of the client is closed too
+        assert fox._closed
+
+    asyncio.run(run())
+    assert len(polls) == 3
+
+
+def test_async_iteration_requires_async_client():
+    from fetchfox_sdk import FetchFox
+
+    workflow = FetchFox(api_key="test_key").extract(
+        "https://example.com", {"name": "The name"})
+
+    async def run():
+        async for _ in workflow:
+            pass
+
+    with pytest.raises(TypeError):
+        asyncio.run(run())
+
+
+def test_stream_job_async_skips_seen_items():
+    def handler(request):
+        assert request.url.params.get("cursor") == "c1"
+        return httpx.Response(200, json={"done": True, "cursor": "c2",
+            "results": {"items": [_item(1), _item(2)]}})
+
+    async def run():
+        async with _mock_fox(handler) as fox:
+            stream = fox.stream_job_async(
+                "job_1", cursor="c1", seen_ids=["id_1"])
+            names = [item.name async for item in stream]
+            assert names == ["item 2"]
+            assert stream.state() == {
+                "job_id": "job_1", "cursor": "c2", "seen_ids": ["id_1", "id_2"]}
+
+    asyncio.run(run())
+
+
+def test_async_iteration_runs_shards_concurrently():
+    import json
+
+    urls = [f"https://example.com/{i}" for i in range(5)]
+    runs = []
+
+    def handler(request):
+        path = request.url.path
+        if path.endswith("/workflows"):
+            items = json.loads(request.content)["steps"][0]["args"]["items"]
+            return httpx.Response(200,
+                json={"id": f"wf_{urls.index(items[0]['url']) // 2}"})
+        if path.endswith("/run"):
+            shard = path.split("/")[-2][len("wf_"):]
+            runs.append(json.loads(request.content))
+            return httpx.Response(200, json={"jobId": f"job_{shard}"})
+        if "/jobs/job_" in path:
+            shard = int(path.rsplit("_", 1)[1])
+            return httpx.Response(200, json={
+                "done": True, "results": {"items": [_item(shard)]}})
+        return httpx.Response(500)
+
+    async def run():
+        async with _mock_fox(handler) as fox:
+            workflow = fox.extract(urls, {"name": "The name"}).configure_params(
+                {"country": "US"})
+            workflow.set_sharding(2, max_concurrency=2)
+            names = [item.name async for item in workflow]
+            assert names == ["item 0", "item 1", "item 2"]
+            assert workflow._ran_job_ids == ["job_0", "job_1", "job_2"]
+            assert workflow.has_results
+
+    asyncio.run(run())
+    assert runs == [{"params": {"country": "US"}}] * 3
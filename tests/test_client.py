@@ -0,0 +1,946 @@
+import concurrent.futures
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+import pytest
+import requests
+import responses
+from responses import matchers
+
+from fetchfox_sdk import (
+    CompactItem, FetchFox, Item, RateLimiter, ResultCache, RetryPolicy)
+from fetchfox_sdk.client import TRACE
+from fetchfox_sdk.polling import PollScheduler
+from fetchfox_sdk.results import ResultStore
+
+
+@pytest.fixture
+def fox():
+    return FetchFox(api_key="test_key", host="http://127.0.0.1")
+
+
+def test_requests_share_one_pooled_session(fox):
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": False}, status=200)
+
+        for _ in range(3):
+            fox._get_job_status("job_1")
+
+    stats = fox.pool_stats()
+    assert stats["requests"] == 3
+    assert stats["sessions_created"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_idle_pool_is_evicted():
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1", idle_timeout=0)
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": False}, status=200)
+
+        fox._get_job_status("job_1")
+        fox._get_job_status("job_1")
+
+    stats = fox.pool_stats()
+    assert stats["sessions_created"] == 2
+    assert stats["idle_evictions"] == 1
+
+
+def test_transient_errors_are_retried():
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        retry_policy=RetryPolicy(backoff_base=0, jitter=False))
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", status=503)
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", status=502)
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True}, status=200)
+
+        assert fox._get_job_status("job_1") == {"done": True}
+        assert len(rsps.calls) == 3
+
+    assert fox.retry_stats()["retries"] == 2
+
+
+def test_post_is_not_retried_on_gateway_error():
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        retry_policy=RetryPolicy(backoff_base=0, jitter=False))
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run", status=502)
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            fox._request("POST", "workflows/wf_1/run")
+        assert len(rsps.calls) == 1
+
+
+def test_retry_after_header_is_honored():
+    policy = RetryPolicy(backoff_base=0, jitter=False)
+    response = requests.Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = "7"
+    error = requests.exceptions.HTTPError(response=response)
+
+    assert policy.get_delay("GET", 0, error, elapsed=0) == 7
+    # ...unless waiting would blow through the deadline
+    assert policy.get_delay("GET", 0, error, elapsed=policy.deadline - 1) is None
+
+
+def _item(i):
+    return {"name": f"item {i}", "_meta": {"id": f"id_{i}"}}
+
+
+def test_job_results_are_fetched_incrementally(fox, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": False, "cursor": "c1",
+                  "results": {"items": [_item(1), _item(2)]}},
+            match=[matchers.query_param_matcher(
+                {"incremental": "true", "exclude": "full"})])
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True, "cursor": "c2",
+                  "results": {"items": [_item(3)]}},
+            match=[matchers.query_param_matcher(
+                {"incremental": "true", "cursor": "c1", "exclude": "full"})])
+
+        items = list(fox._job_result_items_gen("job_1"))
+
+    assert [item["name"] for item in items] == ["item 1", "item 2", "item 3"]
+
+
+def test_job_results_fall_back_to_full_polls(fox, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": False, "results": {"items": [_item(1)]}},
+            match=[matchers.query_param_matcher(
+                {"incremental": "true", "exclude": "full"})])
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True, "results": {"items": [_item(1), _item(2)]}},
+            match=[matchers.query_param_matcher({"exclude": "full"})])
+
+        items = list(fox._job_result_items_gen("job_1"))
+
+    assert [item["name"] for item in items] == ["item 1", "item 2"]
+
+
+def test_poll_scheduler_speeds_up_and_backs_off():
+    scheduler = PollScheduler(min_interval=1, max_interval=8)
+
+    assert [scheduler.unscheduled() for _ in range(5)] == [1, 2, 4, 8, 8]
+
+    assert scheduler.next_delay(0) == 1.5
+    assert scheduler.next_delay(0) == 2.25
+    assert scheduler.next_delay(3) == 1
+    assert scheduler.next_delay(3, hint=5) == 5
+
+
+def test_unscheduled_job_polls_back_off(fox, monkeypatch):
+    delays = []
+    monkeypatch.setattr("time.sleep", delays.append)
+    with responses.RequestsMock() as rsps:
+        for _ in range(3):
+            rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", status=404)
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": False})
+
+        fox._poll_status_once("job_1")
+
+    assert delays == [0.5, 1.0, 2.0]
+
+
+def test_job_watcher_polls_many_jobs_with_one_bulk_request():
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        poll_min_interval=0.01, poll_max_interval=0.05)
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}jobs/status",
+            json={"jobs": {
+                "job_1": {"done": True, "results": {"items": [_item(1)]}},
+                "job_2": {"done": True, "results": {"items": [_item(2)]}},
+            }})
+
+        # Hold the watcher back until both jobs are attached
+        with fox._watcher._cond:
+            watched = [fox._watcher.watch(job_id=job_id)
+                for job_id in ("job_1", "job_2")]
+
+        assert [w.future.result(timeout=5) for w in watched] == [
+            [_item(1)], [_item(2)]]
+        assert len(rsps.calls) == 1
+
+
+def test_job_watcher_survives_errors_and_cancelled_futures(monkeypatch):
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        poll_min_interval=0.01, poll_max_interval=0.05)
+    watcher = fox._watcher
+
+    # A cancelled future stops its job being polled
+    with watcher._cond:
+        cancelled = watcher.watch(job_id="job_1")
+        assert cancelled.future.cancel()
+    assert watcher.watched_job_ids == []
+
+    # An error polling fails the futures, instead of killing the poller
+    def fail(due):
+        raise RuntimeError("client closed")
+    monkeypatch.setattr(watcher, "_fetch_statuses", fail)
+    failed = watcher.watch(job_id="job_2")
+    with pytest.raises(RuntimeError, match="client closed"):
+        failed.future.result(timeout=5)
+    assert watcher._thread.is_alive()
+    fox.close()
+
+
+def test_results_future_uses_job_watcher():
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        poll_min_interval=0.01, poll_max_interval=0.05)
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", json={"id": "wf_1"})
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", status=404)
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True, "results": {"items": [_item(1)]}})
+
+        future = workflow.results_future()
+        assert future.result(timeout=5) == [_item(1)]
+
+    assert workflow.has_run
+    assert workflow._results == [_item(1)]
+
+
+def test_executor_is_owned_by_client_and_closed_with_it():
+    with FetchFox(api_key="test_key", max_workers=2) as fox:
+        assert fox._submit(lambda: 42).result() == 42
+    with pytest.raises(RuntimeError):
+        fox._submit(lambda: 42)
+
+
+def test_injected_executor_is_used_and_left_open():
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    fox = FetchFox(api_key="test_key", executor=executor)
+    assert fox._submit(lambda: 42).result() == 42
+    fox.close()
+    assert executor.submit(lambda: 7).result() == 7
+    executor.shutdown()
+
+
+def test_max_pending_applies_backpressure():
+    fox = FetchFox(api_key="test_key", max_workers=1, max_pending=1)
+    release = threading.Event()
+    first = fox._submit(release.wait)
+
+    submitted = threading.Event()
+    def submit_second():
+        fox._submit(lambda: None)
+        submitted.set()
+    threading.Thread(target=submit_second).start()
+
+    assert not submitted.wait(timeout=0.1)
+    release.set()
+    assert submitted.wait(timeout=5)
+    assert first.result() is True
+    fox.close()
+
+
+def test_response_bodies_are_not_formatted_unless_tracing(fox, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("pformat should not be called")
+    monkeypatch.setattr("fetchfox_sdk.client.pformat", fail)
+
+    seen = []
+    fox.response_hook = lambda method, path, response, body: seen.append(path)
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", json={"done": False})
+        fox._get_job_status("job_1")
+
+    assert seen == ["jobs/job_1"]
+
+
+def test_traced_response_bodies_can_be_truncated(caplog):
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        log_level="trace", trace_max_chars=10)
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": False, "padding": "x" * 100})
+        with caplog.at_level(TRACE, logger="fetchfox"):
+            fox._get_job_status("job_1")
+
+    message = caplog.records[-1].getMessage()
+    assert "more chars]" in message
+    assert "x" * 100 not in message
+    fox.logger.setLevel(logging.WARNING)
+
+
+def test_workflow_can_opt_out_of_job_details(fox, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+    workflow.set_job_details(log_summaries=False, max_intermediate_items=1)
+
+    status = {
+        "done": True,
+        "results": {
+            "full": [{"items": [
+                {"url": "https://a", "_meta": {"id": "i_1"}},
+                {"url": "https://b", "_meta": {"id": "i_2"}},
+            ]}],
+            "items": [_item(1)],
+            "logs": {"tail": [{"timestamp": 1, "message": "working"}]},
+        },
+    }
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", json={"id": "wf_1"})
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", json=status,
+            match=[matchers.query_param_matcher({"incremental": "true"})])
+
+        assert list(workflow) == [_item(1)]
+
+    assert list(workflow._last_job['intermediate_items']) == [
+        {"url": "https://b", "_meta": {"id": "i_2"}}]
+    assert workflow.get_new_log_summaries() == []
+
+
+def test_new_log_summaries_are_bounded_by_the_buffer(fox):
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+    workflow.set_job_details(max_log_summaries=2)
+    logs = workflow._last_job['log_summaries']
+
+    logs.extend([(1, "one"), (2, "two")])
+    assert workflow.get_new_log_summaries() == [(1, "one"), (2, "two")]
+    logs.extend([(3, "three"), (4, "four"), (5, "five")])
+    assert workflow.get_new_log_summaries() == [(4, "four"), (5, "five")]
+    assert workflow.get_new_log_summaries() == []
+    assert workflow._last_job['log_summaries_yielded_s'] == {
+        (4, "four"), (5, "five")}
+
+
+def test_identical_workflows_are_registered_once(tmp_path):
+    cache_path = str(tmp_path / "workflows.json")
+    template = {"name": "What's the name?"}
+
+    with responses.RequestsMock() as rsps:
+        register = rsps.add(responses.POST, "http://127.0.0.1/api/v2/workflows",
+            json={"id": "wf_1"})
+        rsps.add(responses.POST, "http://127.0.0.1/api/v2/workflows/wf_1/run",
+            json={"jobId": "job_1"})
+
+        fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+            workflow_cache_path=cache_path)
+        fox._run_workflow(workflow=fox.extract("https://example.com", template))
+        fox._run_workflow(workflow=fox.extract("https://example.com", template))
+
+        # A new process sharing the cache file reuses the ID too
+        other_fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+            workflow_cache_path=cache_path)
+        other_fox._run_workflow(
+            workflow=other_fox.extract("https://example.com", template))
+
+        assert register.call_count == 1
+
+
+def test_stale_cached_workflow_is_registered_again(fox):
+    template = {"name": "What's the name?"}
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", json={"id": "wf_1"})
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+        fox._run_workflow(workflow=fox.extract("https://example.com", template))
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run", status=404)
+        rsps.add(responses.POST, f"{fox.base_url}workflows", json={"id": "wf_2"})
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_2/run",
+            json={"jobId": "job_2"})
+        job_id = fox._run_workflow(
+            workflow=fox.extract("https://example.com", template))
+
+    assert job_id == "job_2"
+
+
+def test_identical_workflows_reuse_cached_results(tmp_path, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    template = {"name": "What's the name?"}
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, "http://127.0.0.1/api/v2/workflows",
+            json={"id": "wf_1"})
+        run = rsps.add(responses.POST,
+            "http://127.0.0.1/api/v2/workflows/wf_1/run", json={"jobId": "job_1"})
+        rsps.add(responses.GET, "http://127.0.0.1/api/v2/jobs/job_1",
+            json={"done": True, "results": {"items": [_item(1), _item(2)]}})
+
+        fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+            result_cache=ResultCache(str(tmp_path)))
+        assert list(fox.extract("https://example.com", template)) == [
+            _item(1), _item(2)]
+
+        # A later run, e.g. of the same script, is served from disk
+        other_fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+            result_cache=ResultCache(str(tmp_path)))
+        workflow = other_fox.extract("https://example.com", template)
+        assert workflow.results_future().result() == [_item(1), _item(2)]
+        assert run.call_count == 1
+
+
+def test_result_cache_expires_and_evicts(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path), ttl=60, max_bytes=None)
+    cache.put("a", [_item(1)])
+    assert cache.get("a") == [_item(1)]
+
+    now = time.time()
+    monkeypatch.setattr("time.time", lambda: now + 120)
+    assert cache.get("a") is None
+    assert cache.size() == 0
+    monkeypatch.undo()
+
+    cache.put("a", [_item(1)])
+    entry_size = cache.size()
+    # Room for two entries, not three
+    cache = ResultCache(str(tmp_path / "lru"), max_bytes=entry_size * 5 // 2)
+    for i, digest in enumerate(["a", "b"]):
+        cache.put(digest, [_item(1)])
+        os.utime(cache._path(digest), (now - 10 + i, now - 10 + i))
+    assert cache.get("a") is not None # now the most recently used
+    cache.put("c", [_item(1)])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_result_store_shares_keys_and_hands_out_stored_items(fox, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", json={"id": "wf_1"})
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True, "results": {"items": [_item(1), _item(2)]}})
+
+        assert len(workflow) == 2
+
+    assert len(workflow._results._schemas) == 1
+    # The stored CompactItem itself, not a new Item each time
+    assert workflow[1] is workflow[1]
+    assert workflow[1] == _item(2)
+    assert workflow[:1] == [_item(1)]
+    assert _item(2) in workflow
+    assert workflow._results == [_item(1), _item(2)]
+
+
+def test_compact_items_share_a_schema_and_act_like_dicts():
+    first = CompactItem.from_dict(_item(1))
+    second = CompactItem.from_dict(_item(2), schema=first._schema)
+
+    assert not hasattr(first, "__dict__")
+    assert first._schema is second._schema
+    assert second.name == "item 2" and second["_meta"] == {"id": "id_2"}
+    assert second.get("missing", 0) == 0
+    assert dict(second) == second.to_dict() == _item(2)
+    assert list(second.keys()) == ["name", "_meta"]
+    assert second == Item(_item(2)) and Item(_item(2)) == second
+    with pytest.raises(AttributeError):
+        second.missing
+
+
+def test_export_streams_csv_with_template_header(fox, monkeypatch, tmp_path):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+    filename = str(tmp_path / "out.csv")
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", json={"id": "wf_1"})
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": False, "results": {"items": [_item(1)]}})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True, "results": {"items": [_item(1), _item(2)]}})
+
+        stats = workflow.export(filename)
+
+    assert stats["items"] == 2 and stats["format"] == "csv"
+    with open(filename) as f:
+        assert f.read().splitlines() == [
+            "name,_meta,_extra",
+            "item 1,{'id': 'id_1'},",
+            "item 2,{'id': 'id_2'},",
+        ]
+    # Kept as well, so deriving a workflow doesn't run this one again
+    assert workflow.has_results and workflow.job_state == "complete"
+    derived = workflow.extract({"price": "What's the price?"})
+    assert [step["name"] for step in derived._workflow["steps"]] == [
+        "const", "extract"]
+
+    # With results at hand, the header covers every field
+    workflow.export(filename, overwrite=True)
+    with open(filename) as f:
+        assert f.readline().strip() == "_meta,name"
+
+
+def test_export_can_skip_keeping_results(fox, monkeypatch, tmp_path):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", json={"id": "wf_1"})
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True, "results": {"items": [_item(1), _item(2)]}})
+
+        stats = workflow.export(str(tmp_path / "out.jsonl"), keep_results=False)
+
+    assert stats["items"] == 2
+    assert workflow._results is None and workflow.job_state == "exported"
+
+    # Deriving a workflow fetches the results from the same job, rather
+    # than running the workflow's steps again
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True, "results": {"items": [_item(1), _item(2)]}})
+        derived = workflow.extract({"price": "What's the price?"})
+    assert derived._workflow["steps"][0]["args"]["items"] == [_item(1), _item(2)]
+    assert workflow.job_state == "complete"
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".arrow"])
+def test_export_to_columnar_formats(fox, monkeypatch, tmp_path, extension):
+    pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+    filename = str(tmp_path / f"out{extension}")
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", json={"id": "wf_1"})
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True, "results": {"items": [_item(i) for i in range(5)]}})
+
+        stats = workflow.export(filename, batch_size=2)
+
+    if extension == ".parquet":
+        parquet_file = pyarrow.parquet.ParquetFile(filename)
+        assert parquet_file.metadata.num_row_groups == 3
+        table = parquet_file.read()
+    else:
+        table = pyarrow.ipc.open_file(filename).read_all()
+    assert stats["items"] == 5
+    assert table.column_names == ["name", "_meta", "_extra"]
+    assert table.column("name").to_pylist() == [f"item {i}" for i in range(5)]
+    assert table.column("_meta").to_pylist()[1] == '{"id": "id_1"}'
+    assert table.column("_extra").to_pylist() == [None] * 5
+
+
+@pytest.mark.parametrize("filename", ["out.jsonl.gz", "out.csv.gz", "out.jsonl.zst"])
+def test_export_compressed(fox, tmp_path, filename):
+    if filename.endswith(".zst"):
+        zstandard = pytest.importorskip("zstandard")
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+    workflow._results = ResultStore([_item(1), _item(2)])
+    path = str(tmp_path / filename)
+
+    stats = workflow.export(path)
+
+    with open(path, "rb") as f:
+        data = f.read()
+    if filename.endswith(".gz"):
+        assert stats["codec"] == "gzip"
+        text = gzip.decompress(data).decode()
+    else:
+        assert stats["codec"] == "zstd"
+        text = zstandard.ZstdDecompressor().decompressobj().decompress(data).decode()
+    if ".jsonl" in filename:
+        assert [json.loads(line) for line in text.splitlines()] == [_item(1), _item(2)]
+    else:
+        assert text.splitlines()[0] == "_meta,name"
+    assert stats["items"] == 2 and stats["bytes"] == len(data)
+
+
+def test_interrupted_export_resumes_where_it_stopped(fox, monkeypatch, tmp_path):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    template = {"name": "What's the name?"}
+    filename = str(tmp_path / "out.jsonl.gz")
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", json={"id": "wf_1"})
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": False, "results": {"items": [_item(1), _item(2)]}})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", status=401)
+        stop = rsps.add(responses.POST, f"{fox.base_url}jobs/job_1/stop",
+            json={})
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            fox.extract("https://example.com", template).export(
+                filename, resume=True, flush_interval=0)
+
+        # The job is left running for the next attempt, even on Ctrl-C
+        assert stop.call_count == 0
+        assert "job_1" not in fox._attached_jobs
+        rsps.remove(stop)
+
+    assert not os.path.exists(filename)
+    assert os.path.exists(filename + ".part")
+
+    # Later, e.g. in a new process: no new job, only the missing item is added
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True,
+                  "results": {"items": [_item(1), _item(2), _item(3)]}})
+
+        workflow = fox.extract("https://example.com", template)
+        stats = workflow.export(filename, resume=True)
+
+    assert stats["items"] == 1
+    with gzip.open(filename, "rt") as f:
+        assert [json.loads(line) for line in f] == [_item(1), _item(2), _item(3)]
+    assert sorted(os.listdir(tmp_path)) == ["out.jsonl.gz"]
+    assert workflow.job_state == "exported"
+
+    # Exporting again fetches the results from the job, without a new run
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True,
+                  "results": {"items": [_item(1), _item(2), _item(3)]}})
+        stats = workflow.export(str(tmp_path / "again.jsonl"))
+    assert stats["items"] == 3
+    assert [item.name for item in workflow] == ["item 1", "item 2", "item 3"]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX permissions")
+def test_exported_file_gets_default_permissions(fox, tmp_path):
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+    workflow._results = ResultStore([_item(1)])
+    filename = str(tmp_path / "out.jsonl")
+
+    umask = os.umask(0o022)
+    try:
+        workflow.export(filename)
+    finally:
+        os.umask(umask)
+
+    # As with open(), not the 0600 of a temporary file
+    assert os.stat(filename).st_mode & 0o777 == 0o644
+
+
+def test_failed_export_leaves_no_file(fox, tmp_path):
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+    filename = str(tmp_path / "out.jsonl")
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", status=401)
+        with pytest.raises(requests.exceptions.HTTPError):
+            workflow.export(filename)
+    assert os.listdir(tmp_path) == []
+
+
+def test_derived_workflows_share_parent_results(fox):
+    parent = fox.extract("https://example.com", {"name": "What's the name?"})
+    parent._results = ResultStore([_item(1), _item(2)])
+    parent._ran_job_id = "job_1"
+
+    first = parent.filter("only the good ones")
+    second = parent.unique("name").limit(1)
+
+    first_items = first._workflow["steps"][0]["args"]["items"]
+    assert first_items is second._workflow["steps"][0]["args"]["items"]
+    assert first_items == [_item(1), _item(2)]
+    assert json.loads(second.to_json()) == second.to_dict()
+
+    # Changes to nested values, in the parent's items or in the dicts the
+    # snapshot returns, don't reach the snapshot
+    parent._results.view(0)["_meta"]["id"] = "changed"
+    first_items[1]["_meta"]["id"] = "changed"
+    assert first_items == [_item(1), _item(2)]
+    assert second.to_dict()["steps"][0]["args"]["items"] == [_item(1), _item(2)]
+
+
+def test_derived_workflows_can_reference_parent_job(monkeypatch):
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        reference_results=True)
+    parent = fox.extract("https://example.com", {"name": "What's the name?"})
+    parent._results = ResultStore([_item(1)])
+    parent._ran_job_id = "job_1"
+
+    with responses.RequestsMock() as rsps:
+        register = rsps.add(responses.POST, f"{fox.base_url}workflows",
+            json={"id": "wf_2"})
+        fox._register_workflow(parent.filter("only the good ones"))
+        sent = json.loads(register.calls[0].request.body)
+        assert sent["steps"][0] == {"name": "const", "args": {"job": "job_1"}}
+
+    # Servers which don't understand the reference get the items instead
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", status=400)
+        register = rsps.add(responses.POST, f"{fox.base_url}workflows",
+            json={"id": "wf_3"})
+        assert fox._register_workflow(parent.limit(1)) == "wf_3"
+        sent = json.loads(rsps.calls[1].request.body)
+        assert sent["steps"][0]["args"]["items"] == [_item(1)]
+    assert not fox.reference_results
+
+
+def test_large_inputs_are_sharded_into_concurrent_jobs(fox, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    urls = [f"https://example.com/{i}" for i in range(5)]
+    workflow = fox.extract(urls, {"name": "What's the name?"}).configure_params(
+        {"country": "US"})
+    workflow.set_sharding(2, max_concurrency=2)
+
+    def register(request):
+        items = json.loads(request.body)["steps"][0]["args"]["items"]
+        first = urls.index(items[0]["url"])
+        return 200, {}, json.dumps({"id": f"wf_{first // 2}"})
+
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(responses.POST, f"{fox.base_url}workflows",
+            callback=register)
+        for shard in range(3):
+            rsps.add(responses.POST, f"{fox.base_url}workflows/wf_{shard}/run",
+                json={"jobId": f"job_{shard}"})
+            rsps.add(responses.GET, f"{fox.base_url}jobs/job_{shard}",
+                json={"done": True, "results": {"items": [_item(shard)]}})
+
+        names = [item.name for item in workflow.results()]
+
+        # Every shard runs with the workflow's params
+        sent = [json.loads(call.request.body)
+            for call in rsps.calls if call.request.url.endswith("/run")]
+        assert sent == [{"params": {"country": "US"}}] * 3
+
+    assert names == ["item 0", "item 1", "item 2"]
+    assert workflow._ran_job_ids == ["job_0", "job_1", "job_2"]
+    assert workflow.has_results
+
+
+def test_closing_a_sharded_run_never_starts_waiting_shards():
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        rate_limiter=RateLimiter(max_jobs=1),
+        poll_min_interval=0.01, poll_max_interval=0.05)
+    urls = [f"https://example.com/{i}" for i in range(2)]
+    workflow = fox.extract(urls, {"name": "What's the name?"})
+    workflow.set_sharding(1, max_concurrency=2)
+
+    def register(request):
+        url = json.loads(request.body)["steps"][0]["args"]["items"][0]["url"]
+        return 200, {}, json.dumps({"id": "wf_" + url[-1]})
+
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+        rsps.add_callback(responses.POST, f"{fox.base_url}workflows",
+            callback=register)
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_0/run",
+            json={"jobId": "job_0"})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_0",
+            json={"done": False, "results": {"items": [_item(0)]}})
+        stop = rsps.add(responses.POST, f"{fox.base_url}jobs/job_0/stop",
+            json={})
+        second = rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+
+        # The second shard waits for the first job's slot
+        for item in workflow:
+            break
+        time.sleep(3 * fox._watcher.SLOT_CHECK_INTERVAL)
+
+        assert stop.call_count == 1
+        assert second.call_count == 0
+    fox.close()
+
+
+def test_map_runs_one_registered_workflow_per_input(fox, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    template = fox.extract("https://example.com/{{state}}",
+        {"name": "What's the name?"}).configure_params({"country": "US"})
+    states = ["AK", "HI", "OR"]
+
+    def run(request):
+        state = json.loads(request.body)["params"]["state"]
+        return 200, {}, json.dumps({"jobId": f"job_{state}"})
+
+    with responses.RequestsMock() as rsps:
+        register = rsps.add(responses.POST, f"{fox.base_url}workflows",
+            json={"id": "wf_1"})
+        rsps.add_callback(responses.POST,
+            f"{fox.base_url}workflows/wf_1/run", callback=run)
+        for i, state in enumerate(states):
+            rsps.add(responses.GET, f"{fox.base_url}jobs/job_{state}",
+                json={"done": True, "results": {"items": [_item(i)]}})
+
+        results = list(fox.map(template, [{"state": s} for s in states],
+            concurrency=2, ordered=True))
+
+        assert register.call_count == 1
+        sent = [json.loads(call.request.body)["params"]
+            for call in rsps.calls if call.request.url.endswith("/run")]
+        assert sorted(sent, key=lambda p: p["state"]) == [
+            {"country": "US", "state": state} for state in states]
+
+    assert [(params["state"], item.name) for params, item in results] == [
+        ("AK", "item 0"), ("HI", "item 1"), ("OR", "item 2")]
+
+
+def test_rate_limiter_paces_requests_and_backs_off_on_429(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("time.time", lambda: now[0])
+    sleeps = []
+    monkeypatch.setattr("time.sleep", sleeps.append)
+    limiter = RateLimiter(rate=10, burst=2, min_rate=1, recovery=1)
+
+    assert [round(limiter.reserve(), 3) for _ in range(3)] == [0, 0, 0.1]
+
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        rate_limiter=limiter, retry_policy=RetryPolicy(jitter=False))
+    now[0] += 10
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}workflows", status=429,
+            headers={"Retry-After": "3"})
+        rsps.add(responses.GET, f"{fox.base_url}workflows", json={"results": []})
+        fox._request("GET", "workflows")
+
+    # Halved by the 429, then one success gave some of it back
+    assert limiter.current_rate == 6
+    assert 3 in sleeps
+
+
+def test_rate_limiter_caps_running_jobs(fox, tmp_path):
+    fox.rate_limiter = RateLimiter(max_jobs=1, shared_dir=str(tmp_path))
+    other = RateLimiter(max_jobs=1, shared_dir=str(tmp_path))
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True, "results": {"items": [_item(1)]}})
+
+        fox._run_workflow(workflow_id="wf_1")
+        # Another process using the same directory has to wait
+        assert other.acquire_job(block=False) is None
+
+        assert list(fox._job_result_items_gen("job_1")) == [_item(1)]
+
+    slot = other.acquire_job(block=False)
+    assert slot is not None
+    other.release_job(slot)
+
+
+def test_breaking_out_of_results_stops_the_job(fox, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", json={"id": "wf_1"})
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": False, "results": {"items": [_item(1), _item(2)]}})
+        stop = rsps.add(responses.POST, f"{fox.base_url}jobs/job_1/stop",
+            json={})
+
+        for item in workflow:
+            break
+
+        assert stop.call_count == 1
+
+    assert workflow._job_state == "stopped"
+    assert workflow._results == [_item(1)]
+    assert fox._attached_jobs == []
+
+
+def test_interrupted_results_resume_from_the_same_job(fox, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    workflow = fox.extract("https://example.com", {"name": "What's the name?"})
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, f"{fox.base_url}workflows", json={"id": "wf_1"})
+        rsps.add(responses.POST, f"{fox.base_url}workflows/wf_1/run",
+            json={"jobId": "job_1"})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": False, "cursor": "c1",
+                  "results": {"items": [_item(1)]}})
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", status=403)
+        stop = rsps.add(responses.POST, f"{fox.base_url}jobs/job_1/stop",
+            json={})
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            list(workflow)
+
+        # Left running, to be resumed
+        assert stop.call_count == 0
+        rsps.remove(stop)
+
+    assert workflow.job_state == "partial"
+    assert not workflow.has_results
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True, "cursor": "c2",
+                  "results": {"items": [_item(2)]}},
+            match=[matchers.query_param_matcher(
+                {"incremental": "true", "cursor": "c1"}, strict_match=False)])
+
+        assert [item.name for item in workflow] == ["item 1", "item 2"]
+
+    assert workflow.job_state == "complete"
+    assert workflow._results == [_item(1), _item(2)]
+
+
+def test_stream_job_can_be_continued_from_its_state(fox, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": False, "cursor": "c1",
+                  "results": {"items": [_item(1), _item(2)]}})
+
+        stream = fox.stream_job("job_1")
+        for item in stream:
+            break
+        stream.close()
+
+    # Item 2 was received but never yielded, so the cursor stays behind it
+    state = stream.state()
+    assert state == {"job_id": "job_1", "cursor": None, "seen_ids": ["id_1"]}
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            json={"done": True, "cursor": "c2",
+                  "results": {"items": [_item(1), _item(2), _item(3)]}})
+
+        stream = fox.stream_job(**state)
+        assert [item.name for item in stream] == ["item 2", "item 3"]
+
+    assert stream.done
+    assert stream.cursor == "c2"
+
+
+def test_jobs_waiting_for_a_slot_dont_starve_the_watcher():
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        max_workers=2, rate_limiter=RateLimiter(max_jobs=1),
+        poll_min_interval=0.01, poll_max_interval=0.05)
+    # More jobs than max_workers + max_jobs
+    workflows = [
+        fox.extract(f"https://example.com/{i}", {"name": "What's the name?"})
+        for i in range(4)]
+
+    def register(request):
+        url = json.loads(request.body)["steps"][0]["args"]["items"][0]["url"]
+        return 200, {}, json.dumps({"id": "wf_" + url[-1]})
+
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(responses.POST, f"{fox.base_url}workflows",
+            callback=register)
+        for i in range(4):
+            rsps.add(responses.POST, f"{fox.base_url}workflows/wf_{i}/run",
+                json={"jobId": f"job_{i}"})
+            rsps.add(responses.GET, f"{fox.base_url}jobs/job_{i}",
+                json={"done": True, "results": {"items": [_item(i)]}})
+
+        futures = [workflow.results_future() for workflow in workflows]
+        assert [f.result(timeout=5) for f in futures] == [
+            [_item(i)] for i in range(4)]
+    fox.close()
@@ -0,0 +1,97 @@
+import io
+import json
+
+import pytest
+import requests
+import responses
+
+pytest.importorskip("ijson")
+
+from fetchfox_sdk import FetchFox
+from fetchfox_sdk.streaming import iter_job_status
+
+
+STATUS = {
+    "done": True,
+    "results": {
+        "full": [{"items": [{"url": "https://a", "_meta": {"id": "i_1"}}]}],
+        "items": [
+            {"name": "one", "price": 1.5, "_meta": {"id": "r_1"}},
+            {"name": "two", "tags": ["a", {"b": 2}], "_meta": {"id": "r_2"}},
+        ],
+        "logs": {
+            "tail": [{"timestamp": 1, "message": "working"}],
+            "raw": [{"timestamp": 1, "level": "info", "message": "hi"}],
+        },
+    },
+}
+
+
+def test_items_are_yielded_before_the_rest_of_the_status():
+    events = list(iter_job_status(
+        io.BytesIO(json.dumps(STATUS).encode()),
+        skip=["results.full", "results.logs.raw"]))
+
+    assert events[:2] == [
+        ("item", STATUS["results"]["items"][0]),
+        ("item", STATUS["results"]["items"][1]),
+    ]
+    assert events[2] == ("status", {
+        "done": True,
+        "results": {
+            "logs": {"tail": [{"timestamp": 1, "message": "working"}]},
+            "items": [],
+        },
+    })
+
+
+def test_streamed_job_results_match_buffered_ones():
+    results = {}
+    for stream_status in (True, False):
+        fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+            stream_status=stream_status)
+        intermediate = []
+        with responses.RequestsMock() as rsps:
+            rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", json=STATUS)
+            items = list(fox._job_result_items_gen(
+                "job_1", intermediate_items_dest=intermediate))
+        results[stream_status] = (items, intermediate)
+
+    assert results[True] == results[False]
+    assert [item["name"] for item in results[True][0]] == ["one", "two"]
+
+
+def test_status_cut_short_is_polled_again(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        stream_status=True)
+    body = json.dumps(STATUS)
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1",
+            body=body[:body.index('"two"')])
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", json=STATUS)
+        items = list(fox._job_result_items_gen("job_1"))
+
+    # The item received before the cut isn't yielded again
+    assert [item["name"] for item in items] == ["one", "two"]
+    assert fox.retry_stats()["retries"] == 1
+
+
+def test_streamed_error_responses_are_closed(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    closed = []
+    close = requests.Response.close
+    def recording_close(response):
+        closed.append(response.status_code)
+        close(response)
+    monkeypatch.setattr(requests.Response, "close", recording_close)
+
+    fox = FetchFox(api_key="test_key", host="http://127.0.0.1",
+        stream_status=True)
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", status=404)
+        rsps.add(responses.GET, f"{fox.base_url}jobs/job_1", json=STATUS)
+        assert len(list(fox._job_result_items_gen("job_1"))) == 2
+
+    # The 404 of a job waiting to be scheduled doesn't hold a connection
+    assert 404 in closed